@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Compares populating a wide model with and without validation of trusted properties.
+Run it with GAE_SDK environment variable pointing to App Engine SDK:
+
+    GAE_SDK=/path/to/google_appengine python benchmarks/trusted_populate.py
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import sys
+import timeit
+
+if 'GAE_SDK' in os.environ:
+    sys.path.insert(0, os.environ['GAE_SDK'])
+
+    import dev_appserver
+
+    dev_appserver.fix_sys_path()
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from google.appengine.ext import ndb
+
+from gaeforms.ndb.form import ModelForm, populate_trusted
+from gaeforms.ndb.property import IntegerBounded, SimpleDecimal, FloatBounded, StringBounded, Email
+
+WIDTH = 10
+
+properties = {}
+payload = {}
+for i in xrange(WIDTH):
+    properties[str('integer%s' % i)] = IntegerBounded(lower=0, upper=1000)
+    properties[str('decimal%s' % i)] = SimpleDecimal(decimal_places=2, lower=0, upper=1000)
+    properties[str('float%s' % i)] = FloatBounded(lower=0, upper=1000)
+    properties[str('string%s' % i)] = StringBounded(max_len=100)
+    properties[str('email%s' % i)] = Email()
+    payload.update({'integer%s' % i: '10',
+                    'decimal%s' % i: '10.25',
+                    'float%s' % i: '10.5',
+                    'string%s' % i: 'some string',
+                    'email%s' % i: 'foo@bar.com'})
+
+WideModel = type(str('WideModel'), (ndb.Model,), properties)
+WideForm = type(ModelForm)(str('WideForm'), (ModelForm,), {'_model_class': WideModel})
+
+
+def main(number=2000):
+    form = WideForm(**payload)
+    assert form.validate() == {}
+    normalized = form.normalize()
+    model = WideModel()
+
+    validated = timeit.timeit(lambda: model.populate(**normalized), number=number)
+    trusted = timeit.timeit(lambda: populate_trusted(model, normalized, WideForm._trusted_fields), number=number)
+    print('%s properties, %s runs' % (len(properties), number))
+    print('populate:          %.3fs' % validated)
+    print('populate_trusted:  %.3fs' % trusted)
+    print('saving:            %.1f%%' % (100 * (validated - trusted) / validated))
+
+
+if __name__ == '__main__':
+    main()
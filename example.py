@@ -6,6 +6,7 @@ import sys
 
 from google.appengine.ext.ndb.model import Model, IntegerProperty, StringProperty, BooleanProperty
 
+from gaeforms.base import validator
 from gaeforms.country.br.property import CepProperty
 from gaeforms.ndb.form import ModelForm
 
@@ -36,9 +37,7 @@ class Address(Model):
 class AddressForm(ModelForm):
     _model_class = Address
 
-    def validate(self):
-        errors = super(AddressForm, self).validate()
-        normalized_dct = self.normalize()
-        if normalized_dct['cep_declared'] is True and not self.cep:
-            errors['cep'] = 'If CEP is declared it should not be empty'
-        return errors
+    @validator('cep_declared', 'cep')
+    def validate_cep_declared(self, values):
+        if values['cep_declared'] is True and not values['cep']:
+            return {'cep': 'If CEP is declared it should not be empty'}
@@ -1 +1,10 @@
 __version__ = '0.21'
+
+
+def warmup(locales=None, timezones=None, forms=None):
+    """
+    Preloads locale data, timezones and forms' caches. See gaeforms.preload.warmup
+    """
+    from gaeforms.preload import warmup as _warmup
+
+    return _warmup(locales, timezones, forms)
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+import copy
 import datetime
+import hashlib
+import json
+import operator
 import re
+import threading
+import weakref
 from decimal import Decimal
-from gettext import gettext as _
 
 from babel import dates
 from babel.dates import parse_date, format_date, format_datetime
@@ -12,29 +17,146 @@ from babel.numbers import parse_decimal, format_number, format_decimal
 from google.appengine.ext import ndb
 from google.appengine.ext.ndb import Model
 
-from gaeforms import settings
+from gaeforms import settings, columnar
+from gaeforms.fixedpoint import parse_scaled, scaled_to_decimal, decimal_to_scaled, format_fixed, plain_to_scaled, \
+    _locale_spec
+from gaeforms.i18n import gettext as _
+
+
+class InputTooLarge(ValueError):
+    """
+    Raised when values exceeding size limits are normalized without being validated first
+    """
+
+
+def _freeze(value):
+    """
+    Hashable version of an option value. Types and Decimal exponents are kept, so 1, 1.0, True, Decimal('1.0') and
+    Decimal('1.00') do not share options
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return type(value), tuple(sorted((_freeze(k), _freeze(v)) for k, v in value.iteritems()))
+    if isinstance(value, Decimal):
+        return Decimal, value.as_tuple()
+    return type(value), value
+
+
+class FieldOptions(object):
+    """
+    Immutable options of a field, like required, choices or max_len, and everything compiled from them, like date
+    patterns. They are interned by field class and options' values, so equal fields of different forms share them.
+    Fields keep only their name and input limits, reading options through properties. Setting an option on a field
+    replaces its FieldOptions, so other fields are not affected. Lists, like choices, are kept as tuples
+    """
+
+    def __init__(self, field_class, values):
+        values = {k: tuple(v) if isinstance(v, list) else v for k, v in values.iteritems()}
+        self.__dict__.update(values)
+        self.__dict__['_field_class'] = field_class
+        self.__dict__['_values'] = values
+        self.__dict__['_compiled'] = {}
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Field options are immutable. Set %s on the field instead' % name)
+
+    def replace(self, **values):
+        """
+        :return: interned FieldOptions with values replaced
+        """
+        new_values = dict(self._values)
+        new_values.update(values)
+        return intern_options(self._field_class, new_values)
+
+    def compiled(self, key, build):
+        """
+        Value compiled from options, built only once for all fields sharing them
+        :param key: hashable key, e.g. ('date_format', locale name)
+        :param build: function without arguments building the value
+        """
+        try:
+            return self._compiled[key]
+        except KeyError:
+            return self._compiled.setdefault(key, build())
+
+
+_interned_options = weakref.WeakValueDictionary()
+_interned_options_lock = threading.Lock()
+
+
+def intern_options(field_class, values):
+    """
+    Gets the FieldOptions shared by fields of field_class with the given options' values. Options with unhashable
+    values are not shared
+    :param field_class: field class
+    :param values: dict with options' names and values
+    :return: FieldOptions
+    """
+    key = (field_class, tuple(sorted((k, _freeze(v)) for k, v in values.iteritems())))
+    try:
+        hash(key)
+    except TypeError:
+        return FieldOptions(field_class, values)
+    with _interned_options_lock:
+        options = _interned_options.get(key)
+        if options is None:
+            options = FieldOptions(field_class, values)
+            _interned_options[key] = options
+        return options
+
+
+def _option(name):
+    """
+    Field property reading an option from field's FieldOptions. Setting it replaces field's FieldOptions
+    """
+
+    def set(field, value):
+        field._options = field._options.replace(**{name: value})
+
+    # attrgetter reads through _options in C, keeping options as cheap to read as plain attributes
+    return property(operator.attrgetter('_options.' + name), set)
 
 
 class BaseField(object):
+    # Relative cost of validate_field. Fail fast validation runs cheaper fields first
+    _cost = 1
+    # Maximum number of elements' errors collected when validating a repeated field. None means no limit
+    max_errors = None
+    # Maximum length of string values, checked before any parsing. None means no limit
+    max_input_len = None
+    # Maximum number of elements of a repeated field, checked before validating them. None means no limit
+    max_items = None
+    # If False, forms do not keep this field's normalized value, e.g. when it is mutable and shared by models
+    _memoize_normalize = True
+    # If False, validation may give different results for the same value, so forms with this field are not cached
+    _deterministic = True
+    # numpy dtype of columns built by Form.normalize_many. None means object columns
+    column_dtype = None
+    required = _option('required')
+    default = _option('default')
+    repeated = _option('repeated')
+    choices = _option('choices')
+
     def __init__(self, required=False, default=None, repeated=False, choices=None):
-        self.repeated = repeated
-        self.choices = choices
-        self.default = default
-        self.required = required
+        self._options = intern_options(type(self), {'required': required, 'default': default, 'repeated': repeated,
+                                                    'choices': choices})
         self._attr = ''
 
     def set_options(self, model_property):
-        self.required = model_property._required
-        self.default = model_property._default
-        self.repeated = model_property._repeated
-        self.choices = model_property._choices
+        self._options = self._options.replace(required=model_property._required, default=model_property._default,
+                                              repeated=model_property._repeated, choices=model_property._choices)
 
     def _set_attr_name(self, name):
         self._attr = name
 
-    def __set__(self, instance, value):
+    def _store(self, instance, value):
         setattr(instance, '_' + self._attr, value)
 
+    def __set__(self, instance, value):
+        self._store(instance, value)
+        instance._mark_dirty(self._attr)
+
     def validate_field(self, value):
         '''
         Method that must validate the value
@@ -42,33 +164,85 @@ class BaseField(object):
         Ex: If expected input must be int, validate should a return a msg like
         "The filed must be a integer value"
         '''
-        if self.choices:
+        options = self._options
+        if options.choices:
             value = self.normalize_field(value)
-            if value in self.choices:
+            if value in options.choices:
                 return None
-            return _('Must be one of: %(choices)s') % {'choices': '; '.join(self.choices)}
-        if self.default is not None:
+            return _('Must be one of: %(choices)s') % {'choices': '; '.join(options.choices)}
+        if options.default is not None:
             if value is None or value == '':
-                value = self.default
-        if self.required and (value is None or value == ''):
+                value = options.default
+        if options.required and (value is None or value == ''):
             return _('Required field')
 
     def __get__(self, instance, owner):
         return getattr(instance, '_' + self._attr)
 
-    def validate(self, value):
-        if self.repeated:
-            if value:
-                error = None
+    def _is_missing(self, value):
+        """
+        Cheap check for a required field without value, done before any parsing on fail fast validation
+        """
+        options = self._options
+        return options.required and options.default is None and not options.choices and (value is None or value == '')
+
+    def _length_error(self, value):
+        if self.max_input_len is not None and isinstance(value, basestring) and len(value) > self.max_input_len:
+            return _chars_error(len(value), self.max_input_len)
+
+    def _size_error(self, value):
+        """
+        Checks max_items and max_input_len, which need no parsing
+        :return: error msg or None
+        """
+        if not self._options.repeated:
+            return self._length_error(value)
+        if value:
+            if self.max_items is not None and len(value) > self.max_items:
+                return _items_error(len(value), self.max_items)
+            if self.max_input_len is not None:
                 for v in value:
-                    error = self.validate_field(v)
-                return error
+                    error = self._length_error(v)
+                    if error:
+                        return error
+
+    def _validate_one(self, value, fail_fast):
+        error = self._length_error(value)
+        if error:
+            return error
+        if fail_fast and self._is_missing(value):
+            return _('Required field')
+        return self.validate_field(value)
+
+    def validate(self, value, fail_fast=False):
+        """
+        Validates a value, or each element of value if field is repeated
+        :param value: value to be validated
+        :param fail_fast: if True, stops on first invalid element and checks required before parsing
+        Strings longer than max_input_len and repeated values with more than max_items elements are rejected
+        before any parsing
+        :return: None if value is valid and a error msg otherwise. If field is repeated and some elements are invalid,
+        a dict mapping elements' indexes to their error msgs, with at most max_errors entries
+        """
+        if self._options.repeated:
+            if value:
+                if self.max_items is not None and len(value) > self.max_items:
+                    return _items_error(len(value), self.max_items)
+                max_errors = 1 if fail_fast else self.max_errors
+                errors = {}
+                for i, v in enumerate(value):
+                    error = self._validate_one(v, fail_fast)
+                    if error:
+                        errors[i] = error
+                        if max_errors is not None and len(errors) >= max_errors:
+                            break
+                return errors or None
             else:
                 value = None
-        return self.validate_field(value)
+        return self._validate_one(value, fail_fast)
 
     def _execute_one_or_repeated(self, fcn, value):
-        if self.repeated:
+        if self._options.repeated:
             if value:
                 return [fcn(v) for v in value]
             return []
@@ -80,7 +254,11 @@ class BaseField(object):
         localization
         :param value: value to be normalize
         :return: a normalized value
+        :raise InputTooLarge: if value exceeds max_input_len or max_items
         """
+        error = self._size_error(value)
+        if error:
+            raise InputTooLarge(error)
         return self._execute_one_or_repeated(self.normalize_field, value)
 
     def normalize_field(self, value):
@@ -113,42 +291,233 @@ class BaseField(object):
                 value = self.default
         return value or ''
 
+    def normalize_column(self, values):
+        """
+        Validates and normalizes a column of raw values, one per row. Used by Form.normalize_many
+        :param values: list of raw values
+        :return: tuple with list of column values, None for empty and invalid rows, and dict mapping invalid rows'
+        indexes to their errors
+        """
+        column = [None] * len(values)
+        errors = {}
+        for i, value in enumerate(values):
+            error = self.validate(value)
+            if error:
+                errors[i] = error
+            else:
+                column[i] = self._column_value(self.normalize(value))
+        return column, errors
+
+    def _column_value(self, value):
+        """
+        Converts a normalized value to the one stored on columns
+        """
+        return value
+
+    def schema(self):
+        """
+        Builds a JSON Schema describing the field. Repeated fields are described as arrays
+        :return: dict with schema
+        """
+        schema = self.schema_field()
+        if self.repeated:
+            schema = {'type': 'array', 'items': schema}
+            if self.required:
+                schema['minItems'] = 1
+            if self.max_items is not None:
+                schema['maxItems'] = self.max_items
+        return schema
+
+    def schema_field(self):
+        """
+        Method that must build a JSON Schema describing only one value
+        Ex: if the expected type is int, it should return {'type': 'integer'}
+        """
+        schema = {}
+        if self.choices:
+            schema['enum'] = sorted(self.choices)
+        if isinstance(self.default, (basestring, bool, int, long, float)):
+            schema['default'] = self.default
+        return schema
+
 
 _MAX_STRING_LENGTH = 1500
 
 
+def _items_error(items, max_items):
+    return _('Has %(len)s items and it must have %(max_len)s or less') % {'len': items, 'max_len': max_items}
+
+
+def _chars_error(chars, max_chars):
+    return _('Has %(len)s characters and it must have %(max_len)s or less') % {'len': chars, 'max_len': max_chars}
+
+
+def _count_chars(value):
+    """
+    Sums lengths of strings found on value, including nested lists, tuples and dicts' keys and values
+    """
+    chars = 0
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, basestring):
+            chars += len(value)
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+        elif isinstance(value, dict):
+            pending.extend(value.iterkeys())
+            pending.extend(value.itervalues())
+    return chars
+
+
+_PLAIN_INTEGER = re.compile(r'^[+-]?[0-9]+$')
+_PLAIN_NUMBER = re.compile(r'^[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)$')
+
+
+class _NumberColumnMixin(object):
+    """
+    Column normalization for number fields. Strings which are plain numbers once locale's symbols are removed are
+    converted all at once by field's _convert_plain method. Other values are validated one by one
+    """
+    _plain_pattern = _PLAIN_NUMBER
+
+    def _column_bound(self, bound):
+        return bound
+
+    def normalize_column(self, values):
+        if self.repeated:
+            return super(_NumberColumnMixin, self).normalize_column(values)
+        group_symbol, decimal_symbol, format_spec = _locale_spec(settings.get_locale())
+        column = [None] * len(values)
+        errors = {}
+        plain_rows, plain_strings, empty_rows = [], [], []
+        for i, value in enumerate(values):
+            if value is None or value == '':
+                empty_rows.append(i)
+                continue
+            if isinstance(value, basestring) and (self.max_input_len is None or len(value) <= self.max_input_len):
+                string = value.strip().replace(group_symbol, '')
+                if group_symbol == '\xa0':
+                    string = string.replace(' ', '')
+                string = string.replace(decimal_symbol, '.')
+                if self._plain_pattern.match(string):
+                    plain_rows.append(i)
+                    plain_strings.append(string)
+                    continue
+            error = self.validate(value)
+            if error:
+                errors[i] = error
+            else:
+                column[i] = self._column_value(self.normalize(value))
+        for i, converted in zip(plain_rows, self._convert_plain(plain_strings)):
+            column[i] = converted
+        if empty_rows:
+            empty_value = self._column_value(self.normalize(None))
+            for i in empty_rows:
+                column[i] = empty_value
+        self._check_column(values, column, plain_rows + empty_rows, errors)
+        return column, errors
+
+    def _check_column(self, values, column, rows, errors):
+        """
+        Checks required, choices and bounds for the given rows of column at once. Only failing rows are validated one
+        by one, to get their error messages. Invalid rows are cleaned on column
+        """
+        for i in self._failing_rows(column, rows):
+            error = self.validate(values[i])
+            if error:
+                errors[i] = error
+                column[i] = None
+
+    def _failing_rows(self, column, rows):
+        lower = self._column_bound(self.lower)
+        upper = self._column_bound(self.upper)
+        choices = None
+        if self.choices:
+            # validate_field compares normalized values to choices as they are, so only choices which are normalized
+            # values themselves can be compared on column. Otherwise rows are validated one by one
+            choices = []
+            for choice in self.choices:
+                try:
+                    normalized = self.normalize_field(choice)
+                    if normalized != choice:
+                        return rows
+                    choices.append(self._column_value(normalized))
+                except Exception:
+                    return rows
+        null_fails = bool(self.required or choices)
+        if columnar.numpy is not None and rows:
+            try:
+                return columnar.failing_rows([column[i] for i in rows], rows, self.column_dtype, null_fails, lower,
+                                             upper, choices)
+            except (OverflowError, ValueError, TypeError):
+                pass
+        failing = []
+        for i in rows:
+            value = column[i]
+            if value is None:
+                if null_fails:
+                    failing.append(i)
+            elif ((lower is not None and lower > value) or (upper is not None and upper < value) or
+                  (choices is not None and value not in choices)):
+                failing.append(i)
+        return failing
+
+
+def _set_schema_bounds(schema, lower, upper):
+    if lower is not None:
+        schema['minimum'] = float(lower) if isinstance(lower, Decimal) else lower
+    if upper is not None:
+        schema['maximum'] = float(upper) if isinstance(upper, Decimal) else upper
+
+
 # Concrete fields
 class StringField(BaseField):
+    max_len = _option('max_len')
+    exactly_len = _option('exactly_len')
+    min_len = _option('min_len')
+
     def __init__(self, required=False, default=None, repeated=False, choices=None, max_len=_MAX_STRING_LENGTH,
                  exactly_len=None, min_len=None):
         super(StringField, self).__init__(required, default, repeated, choices)
-        self.min_len = min_len
-        self.exactly_len = exactly_len
-        self.max_len = max_len
+        self._options = self._options.replace(min_len=min_len, exactly_len=exactly_len, max_len=max_len)
 
     def set_options(self, model_property):
         super(StringField, self).set_options(model_property)
-        self.max_len = getattr(model_property, 'max_len', None)
-        if self.max_len is None:
-            self.max_len = _MAX_STRING_LENGTH if model_property._indexed else None
-        self.exactly_len = getattr(model_property, 'exactly_len', None)
-        self.min_len = getattr(model_property, 'min_len', None)
+        max_len = getattr(model_property, 'max_len', None)
+        if max_len is None:
+            max_len = _MAX_STRING_LENGTH if model_property._indexed else None
+        self._options = self._options.replace(max_len=max_len, exactly_len=getattr(model_property, 'exactly_len', None),
+                                              min_len=getattr(model_property, 'min_len', None))
 
     def validate_field(self, value):
         if value is not None:
             len_value = len(value)
-            if self.exactly_len is not None and len_value != self.exactly_len:
-                return _('Has %(len)s characters and it must have exactly %(exactly_len)s') % {'len': len_value,
-                                                                                               'exactly_len': self.exactly_len}
-            if self.max_len and len_value > self.max_len:
+            options = self._options
+            if options.exactly_len is not None and len_value != options.exactly_len:
+                msg = _('Has %(len)s characters and it must have exactly %(exactly_len)s')
+                return msg % {'len': len_value, 'exactly_len': options.exactly_len}
+            if options.max_len and len_value > options.max_len:
                 return _('Has %(len)s characters and it must have %(max_len)s or less') % {'len': len_value,
-                                                                                           'max_len': self.max_len}
-            if self.min_len and len_value < self.min_len:
+                                                                                           'max_len': options.max_len}
+            if options.min_len and len_value < options.min_len:
                 return _('Has %(len)s characters and it must have %(min_len)s or more') % {'len': len_value,
-                                                                                           'min_len': self.min_len}
+                                                                                           'min_len': options.min_len}
 
         return super(StringField, self).validate_field(value)
 
+    def schema_field(self):
+        schema = super(StringField, self).schema_field()
+        schema['type'] = 'string'
+        if self.exactly_len is not None:
+            schema['minLength'] = schema['maxLength'] = self.exactly_len
+        else:
+            if self.max_len:
+                schema['maxLength'] = self.max_len
+            if self.min_len:
+                schema['minLength'] = self.min_len
+        return schema
+
 
 class EmailField(StringField):
     def validate_field(self, value):
@@ -157,8 +526,18 @@ class EmailField(StringField):
 
         return super(EmailField, self).validate_field(value)
 
+    def schema_field(self):
+        schema = super(EmailField, self).schema_field()
+        schema['format'] = 'email'
+        return schema
+
 
 class KeyField(BaseField):
+    _cost = 3
+    _deterministic = False
+    max_input_len = 2048
+    kind = _option('kind')
+
     def __init__(self, kind=None, required=False, default=None, repeated=False, choices=None):
         super(KeyField, self).__init__(required, default, repeated, choices)
         self.kind = kind
@@ -212,30 +591,45 @@ class KeyField(BaseField):
             return value.id()
         return super(KeyField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(KeyField, self).schema_field()
+        schema['type'] = ['string', 'integer']
+        return schema
+
+
+class IntegerField(_NumberColumnMixin, BaseField):
+    _cost = 2
+    max_input_len = 32
+    column_dtype = 'int64'
+    _plain_pattern = _PLAIN_INTEGER
+    lower = _option('lower')
+    upper = _option('upper')
 
-class IntegerField(BaseField):
     def __init__(self, required=False, default=None, repeated=False, choices=None, lower=None, upper=None):
         super(IntegerField, self).__init__(required, default, repeated, choices)
-        self.upper = upper
-        self.lower = lower
+        self._options = self._options.replace(lower=lower, upper=upper)
 
     def set_options(self, model_property):
         super(IntegerField, self).set_options(model_property)
-        self.lower = getattr(model_property, 'lower', None)
-        self.upper = getattr(model_property, 'upper', None)
+        self._options = self._options.replace(lower=getattr(model_property, 'lower', None),
+                                              upper=getattr(model_property, 'upper', None))
 
     def validate_field(self, value):
         try:
             value = self.normalize_field(value)
             if value is not None:
-                if self.lower is not None and self.lower > value:
-                    return _('Must be greater than %(lower)s') % {'lower': self.lower}
-                if self.upper is not None and self.upper < value:
-                    return _('Must be less than %(upper)s') % {'upper': self.upper}
+                options = self._options
+                if options.lower is not None and options.lower > value:
+                    return _('Must be greater than %(lower)s') % {'lower': options.lower}
+                if options.upper is not None and options.upper < value:
+                    return _('Must be less than %(upper)s') % {'upper': options.upper}
             return super(IntegerField, self).validate_field(value)
         except:
             return _('Must be integer')
 
+    def _convert_plain(self, strings):
+        return columnar.to_ints(strings)
+
     def normalize_field(self, value):
         if value == '':
             value = None
@@ -251,6 +645,12 @@ class IntegerField(BaseField):
             return int(value)
         return super(IntegerField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(IntegerField, self).schema_field()
+        schema['type'] = 'integer'
+        _set_schema_bounds(schema, self.lower, self.upper)
+        return schema
+
 
 class BooleanField(BaseField):
     def validate_field(self, value):
@@ -278,28 +678,42 @@ class BooleanField(BaseField):
     def localize(self, value):
         return value
 
+    def schema_field(self):
+        schema = super(BooleanField, self).schema_field()
+        schema['type'] = 'boolean'
+        return schema
+
+
+class FloatField(_NumberColumnMixin, BaseField):
+    _cost = 2
+    max_input_len = 64
+    column_dtype = 'float64'
+    lower = _option('lower')
+    upper = _option('upper')
 
-class FloatField(BaseField):
     def __init__(self, required=False, default=None, repeated=False, choices=None, lower=None, upper=None):
         super(FloatField, self).__init__(required, default, repeated, choices)
-        self.upper = upper
-        self.lower = lower
+        self._options = self._options.replace(lower=lower, upper=upper)
 
     def validate_field(self, value):
         try:
             value = self.normalize_field(value)
             if value is not None:
-                if self.lower is not None and self.lower > value:
-                    return _('Must be greater than %(lower)s') % {'lower': self.lower}
-                if self.upper is not None and self.upper < value:
-                    return _('Must be less than %(upper)s') % {'upper': self.upper}
+                options = self._options
+                if options.lower is not None and options.lower > value:
+                    return _('Must be greater than %(lower)s') % {'lower': options.lower}
+                if options.upper is not None and options.upper < value:
+                    return _('Must be less than %(upper)s') % {'upper': options.upper}
             return super(FloatField, self).validate_field(value)
         except:
             return _('Must be a number')
 
+    def _convert_plain(self, strings):
+        return columnar.to_floats(strings)
+
     def normalize_field(self, value):
-        if isinstance(value, (int, float)):
-            return value
+        if isinstance(value, (int, long, float)):
+            return float(value)
         if value == '':
             value = None
         elif value is not None:
@@ -311,64 +725,114 @@ class FloatField(BaseField):
             return format_decimal(value, locale=settings.get_locale())
         return super(FloatField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(FloatField, self).schema_field()
+        schema['type'] = 'number'
+        _set_schema_bounds(schema, self.lower, self.upper)
+        return schema
+
+
+class DecimalField(_NumberColumnMixin, BaseField):
+    """
+    Columns built by Form.normalize_many hold scaled integers, e.g. 1.23 as 123 with 2 decimal places
+    """
+    _cost = 2
+    max_input_len = 64
+    column_dtype = 'int64'
+    decimal_places = _option('decimal_places')
+    lower = _option('lower')
+    upper = _option('upper')
 
-class DecimalField(BaseField):
     def _to_decimal(self, number):
-        return None if number is None else self.normalize_field(unicode(number))
+        return None if number is None else self.normalize_field(number)
 
     def __init__(self, required=False, default=None, repeated=False, choices=None, decimal_places=2, lower=None,
                  upper=None):
         super(DecimalField, self).__init__(required, default, repeated, choices)
         self.decimal_places = decimal_places
-        self.__multiplier = (10 ** self.decimal_places)
-        self.upper = self._to_decimal(upper)
-        self.lower = self._to_decimal(lower)
+        self._options = self._options.replace(lower=self._to_decimal(lower), upper=self._to_decimal(upper))
 
     def set_options(self, model_property):
         super(DecimalField, self).set_options(model_property)
-        self.__multiplier = (10 ** model_property.decimal_places)
         self.decimal_places = model_property.decimal_places
-        self.lower = self._to_decimal(getattr(model_property, 'lower', None))
-        self.upper = self._to_decimal(getattr(model_property, 'upper', None))
+        self._options = self._options.replace(lower=self._to_decimal(getattr(model_property, 'lower', None)),
+                                              upper=self._to_decimal(getattr(model_property, 'upper', None)))
 
     def validate_field(self, value):
         try:
             value = self.normalize_field(value)
             if value is not None:
-                if self.lower is not None and self.lower > value:
-                    return _('Must be greater than %(lower)s') % {'lower': self.lower}
-                if self.upper is not None and self.upper < value:
-                    return _('Must be less than %(upper)s') % {'upper': self.upper}
+                options = self._options
+                if options.lower is not None and options.lower > value:
+                    return _('Must be greater than %(lower)s') % {'lower': options.lower}
+                if options.upper is not None and options.upper < value:
+                    return _('Must be less than %(upper)s') % {'upper': options.upper}
             return super(DecimalField, self).validate_field(value)
         except:
             return _('Must be a number')
 
+    def _convert_plain(self, strings):
+        return [plain_to_scaled(s, self.decimal_places) for s in strings]
+
+    def _column_value(self, value):
+        return None if value is None else decimal_to_scaled(value, self.decimal_places)
+
+    def _column_bound(self, bound):
+        return self._column_value(bound)
+
     def normalize_field(self, value):
+        if isinstance(value, float):
+            value = Decimal(repr(value))
+        elif isinstance(value, (int, long)):
+            value = Decimal(value)
         if isinstance(value, Decimal):
-            return value
-        if value == '':
+            if not value.is_finite():
+                raise ValueError('%s is not a finite number' % value)
+            decimal_places = self._options.decimal_places
+            if value.as_tuple().exponent >= -decimal_places:
+                return value
+            value = scaled_to_decimal(decimal_to_scaled(value, decimal_places), decimal_places)
+        elif value == '':
             value = None
         elif value is not None:
-            value = parse_decimal(value, locale=settings.get_locale())
-            rounded = int(round(Decimal(value) * self.__multiplier))
-            value = Decimal(rounded) / self.__multiplier
+            decimal_places = self._options.decimal_places
+            value = scaled_to_decimal(parse_scaled(value, decimal_places, settings.get_locale()), decimal_places)
         return super(DecimalField, self).normalize_field(value)
 
     def localize_field(self, value):
         if value is not None and value != '':
-            return format_decimal(value, locale=settings.get_locale())
+            return format_fixed(value, settings.get_locale())
         return super(DecimalField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(DecimalField, self).schema_field()
+        schema['type'] = 'number'
+        _set_schema_bounds(schema, self.lower, self.upper)
+        return schema
+
+
+# Dates are parsed with locale's format, so schemas only describe what any locale needs: 3 numbers for date and, for
+# datetime, a date and a time separated by a space
+_DATE_PATTERN = r'\d+\D+\d+\D+\d+'
+_DATETIME_PATTERN = r'^[^ ]*?\d+[^ \d]+\d+[^ \d]+\d+[^ ]* [^ ]*?\d+[^ \d]+\d+[^ \d]+\d+[^ ]*$'
+
 
 class DateFieldMixin(object):
+    format = _option('format')
+
     def localize_date(self, value):
         if isinstance(value, datetime.datetime):
             value = datetime.date(value.year, value.month, value.day)
         pattern = self.get_date_format()
         return format_date(value, format=pattern)
 
-    def get_date_format(self):
-        pattern = dates.get_date_format(format=self.format, locale=settings.get_locale()).pattern
+    def get_date_format(self, locale=None):
+        if locale is None:
+            locale = settings.get_locale()
+        return self._options.compiled(('date_format', str(locale)), lambda: self._build_date_format(locale))
+
+    def _build_date_format(self, locale):
+        pattern = dates.get_date_format(format=self.format, locale=locale).pattern
         for c in ('M', 'd', 'yy'):
             double_char = c * 2
             if double_char not in pattern:
@@ -380,21 +844,88 @@ class DateFieldMixin(object):
 
 
 class DateField(BaseField, DateFieldMixin):
+    _cost = 3
+    max_input_len = 64
+    column_dtype = 'datetime64[D]'
+
     def __init__(self, required=False, default=None, repeated=False, choices=None, format='short'):
         super(DateField, self).__init__(required, default, repeated, choices)
-        self.format = format
+        self._options = self._options.replace(format=format)
 
     def normalize_field(self, value):
         if isinstance(value, basestring):
             return parse_date(value, locale=settings.get_locale())
+        if value is not None and not isinstance(value, datetime.date):
+            raise ValueError('%r is not a date' % (value,))
         return super(DateField, self).normalize_field(value)
 
+    def _column_layout(self, locale):
+        """
+        Regex splitting strings in locale's date format into 3 numbers and the positions of year, month and day among
+        them, which are the ones babel.dates.parse_date uses
+        :return: tuple (regex, year index, month index, day index) or None if locale's patterns are not supported
+        """
+        return self._options.compiled(('date_layout', str(locale)), lambda: self._build_column_layout(locale))
+
+    def _build_column_layout(self, locale):
+        hint = dates.get_date_format(locale=locale).pattern.lower()
+        if 'y' not in hint or 'm' not in hint or 'd' not in hint:
+            return None
+        positions = sorted((hint.index(c), c) for c in 'ymd')
+        indexes = dict((c, i) for i, (_position, c) in enumerate(positions))
+        parts = re.split(r'(y+|M+|d+)', self.get_date_format(locale))
+        literals = parts[::2]
+        if (len(parts) == 7 and all(literals[1:3]) and
+                not any(re.search(r"[A-Za-z0-9']", literal) for literal in literals)):
+            regex = r'(\d{1,4})'.join(re.escape(literal) for literal in literals)
+        else:
+            regex = r'\D*(\d{1,4})\D+(\d{1,4})\D+(\d{1,4})\D*'
+        return re.compile(r'^\s*%s\s*$' % regex), indexes['y'], indexes['m'], indexes['d']
+
+    def normalize_column(self, values):
+        """
+        Splits strings in locale's date format with a regex and builds their dates all at once. Other values and
+        strings which are not existing dates are validated one by one
+        """
+        layout = None if self.repeated or self.choices else self._column_layout(settings.get_locale())
+        if layout is None:
+            return super(DateField, self).normalize_column(values)
+        regex, year_index, month_index, day_index = layout
+        column = [None] * len(values)
+        split_rows, years, months, days, other_rows = [], [], [], [], []
+        for i, value in enumerate(values):
+            if isinstance(value, basestring) and (self.max_input_len is None or len(value) <= self.max_input_len):
+                match = regex.match(value)
+                if match:
+                    numbers = match.groups()
+                    split_rows.append(i)
+                    years.append(numbers[year_index])
+                    months.append(numbers[month_index])
+                    days.append(numbers[day_index])
+                    continue
+            other_rows.append(i)
+        for i, date in zip(split_rows, columnar.to_dates(years, months, days)):
+            if date is None:
+                other_rows.append(i)
+            else:
+                column[i] = date
+        other_rows.sort()
+        other_column, other_errors = super(DateField, self).normalize_column([values[i] for i in other_rows])
+        errors = {}
+        for j, i in enumerate(other_rows):
+            column[i] = other_column[j]
+            if j in other_errors:
+                errors[i] = other_errors[j]
+        return column, errors
+
     def validate_field(self, value):
         try:
             value = self.normalize_field(value)
             return super(DateField, self).validate_field(value)
         except Exception:
-            example = self.localize_field(datetime.date(2016, 12, 25))
+            locale = str(settings.get_locale())
+            example = self._options.compiled(('date_example', locale),
+                                             lambda: self.localize_field(datetime.date(2016, 12, 25)))
             return _('Invalid date. Valid example: %(date)s') % {'date': example}
 
     def localize_field(self, value):
@@ -403,11 +934,21 @@ class DateField(BaseField, DateFieldMixin):
 
         return super(DateField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(DateField, self).schema_field()
+        schema['type'] = 'string'
+        schema['pattern'] = _DATE_PATTERN
+        return schema
+
 
 class DateTimeField(BaseField, DateFieldMixin):
+    _cost = 3
+    max_input_len = 64
+    column_dtype = 'datetime64[us]'
+
     def __init__(self, required=False, default=None, repeated=False, choices=None, format='short'):
         super(DateTimeField, self).__init__(required, default, repeated, choices)
-        self.format = format
+        self._options = self._options.replace(format=format)
 
     def normalize_field(self, value):
         if isinstance(value, basestring):
@@ -440,6 +981,30 @@ class DateTimeField(BaseField, DateFieldMixin):
             return format_datetime(local_dt, pattern)
         return super(DateTimeField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(DateTimeField, self).schema_field()
+        schema['type'] = 'string'
+        schema['pattern'] = _DATETIME_PATTERN
+        return schema
+
+
+def _sort_by_cost(field_items):
+    return tuple(sorted(field_items, key=lambda item: item[1]._cost))
+
+
+def validator(*fields):
+    """
+    Decorator declaring a form method as cross field validator. It is called on validate with a dict of the given
+    fields' normalized values, only if all of them are valid. It must return None or a dict with fields' errors
+    :param fields: names of fields the validator depends on
+    """
+
+    def decorator(fcn):
+        fcn._validator_fields = fields
+        return fcn
+
+    return decorator
+
 
 class _FormMetaclass(type):
     def __new__(cls, class_to_be_created_name, bases, attrs):
@@ -451,29 +1016,358 @@ class _FormMetaclass(type):
                        for attr_name, attr_value in attrs.iteritems()
                        if hasattr(attr_value, '_set_attr_name'))
 
-        attrs['_fields'] = {d._attr: d for d in descriptors}
+        fields = {d._attr: d for d in descriptors}
+        attrs['_fields'] = fields
+        attrs['_fields_by_cost'] = _sort_by_cost(fields.iteritems())
+
+        declared_validators = {attr_name: attr_value._validator_fields for attr_name, attr_value in attrs.iteritems()
+                               if hasattr(attr_value, '_validator_fields')}
+        if declared_validators:
+            field_names = cls._field_names(attrs)
+            for name, validator_fields in sorted(declared_validators.iteritems()):
+                unknown = [f for f in validator_fields if f not in field_names]
+                if unknown:
+                    raise TypeError('Validator %s from class %s depends on unknown fields: %s' %
+                                    (name, class_to_be_created_name, ', '.join(unknown)))
+        validators = {}
+        for base in reversed(bases):
+            validators.update(getattr(base, '_validators', ()))
+        validators.update(declared_validators)
+        attrs['_validators'] = tuple(sorted(validators.iteritems()))
 
         return super(_FormMetaclass, cls).__new__(cls, class_to_be_created_name, bases, attrs)
 
+    @classmethod
+    def _field_names(mcs, attrs):
+        """
+        Names of fields the class being created will have, used to check validators' fields
+        """
+        return attrs['_fields']
+
+
+class _InstanceState(object):
+    """
+    Per instance attribute built by factory on first access, so forms whose __init__ does not call Form.__init__
+    still keep their state
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__.setdefault(self._name, self._factory())
+
 
 class Form(object):
     _fields = ()
+    _fields_by_cost = ()
+    # Cross field validators' names and their fields, declared with validator decorator
+    _validators = ()
+    # Maximum number of elements of each repeated field, besides fields' max_items. None means no limit
+    _max_items = None
+    # Maximum number of characters summing all fields' strings. None means no limit
+    _max_payload_chars = None
+    # Maximum number of payloads on normalize_many and validate_many. None means no limit
+    _max_batch_size = None
+    # Backend caching validation results by payload, like LRUCache or GAE's memcache. None disables the cache
+    _result_cache = None
+    # Seconds cached results live. 0 means backend's default, like LRUCache's ttl
+    _result_cache_time = 0
+    # Names of fields set since creation or last reset
+    _dirty = _InstanceState('_dirty', set)
+    # Names of fields validated without errors since they were last set
+    _valid_fields = _InstanceState('_valid_fields', set)
+    # Memoized normalized values by field name
+    _normalized = _InstanceState('_normalized', dict)
     __metaclass__ = _FormMetaclass
 
     def __init__(self, **kwargs):
+        self._resolve_fields()
         self.fill(**kwargs)
 
+    @classmethod
+    def _resolve_fields(cls):
+        """
+        Hook called before fields are used. Subclasses can override it to build their fields lazily
+        """
+
+    def _mark_dirty(self, name):
+        self._dirty.add(name)
+        self._valid_fields.discard(name)
+        self._normalized.pop(name, None)
+
+    @property
+    def dirty_fields(self):
+        """
+        Names of fields which were set through attribute assignment or fill
+        """
+        return frozenset(self._dirty)
+
+    def _field_items(self, only_dirty=False, fail_fast=False):
+        if only_dirty:
+            field_items = [(k, self._fields[k]) for k in self._dirty]
+            return _sort_by_cost(field_items) if fail_fast else field_items
+        return self._fields_by_cost if fail_fast else self._fields.iteritems()
+
     def fill(self, **kwargs):
         for k, v in self._fields.iteritems():
             if k in kwargs:
                 setattr(self, k, kwargs[k])
 
-    def validate(self):
-        errors = {}
+    def fill_from_mapping(self, mapping):
+        """
+        Fills form with values read straight from a mapping, only for declared fields. If mapping has a getall method,
+        like WebOb's MultiDict, it is used to get all values of repeated fields
+        :param mapping: mapping, e.g. request.params
+        """
+        getall = getattr(mapping, 'getall', None)
         for k, v in self._fields.iteritems():
-            error_msg = v.validate(getattr(self, k, None))
+            if getall is not None and v.repeated:
+                values = getall(k)
+                if values:
+                    setattr(self, k, values)
+            elif k in mapping:
+                setattr(self, k, mapping[k])
+
+    @classmethod
+    def from_multidict(cls, mapping):
+        """
+        Builds a form filled by fill_from_mapping. Unknown keys on mapping are ignored
+        :param mapping: WebOb's MultiDict, like request.params or request.POST, or any other mapping
+        :return: form
+        """
+        form = cls()
+        form.fill_from_mapping(mapping)
+        return form
+
+    def reset(self):
+        """
+        Clears fields' values, dirty fields and validation state, so the instance can be filled again
+        """
+        for k in self._fields:
+            self.__dict__.pop('_' + k, None)
+        self._dirty.clear()
+        self._valid_fields.clear()
+        self._normalized.clear()
+
+    def refill(self, **kwargs):
+        """
+        Resets this form and fills it with kwargs. It has the same effect as building a new instance
+        :return: this form
+        """
+        self.reset()
+        self.fill(**kwargs)
+        return self
+
+    def validate(self, fail_fast=False, only_dirty=False):
+        """
+        Validates form fields. Then runs cross field validators whose fields are all valid, adding their errors.
+        If _result_cache is set, errors and normalized values are cached by fields' values, locale, timezone, schema
+        and validators.
+        Forms with non deterministic fields, like KeyField, are never cached
+        :param fail_fast: if True, fields are validated from the cheapest to the most expensive and validation stops
+        on first error
+        :param only_dirty: if True, only fields present on dirty_fields, and validators depending on them, are validated
+        :return: dict with fields' errors. Empty dict if form is valid. If payload has more than _max_payload_chars
+        characters, fields are not validated and the error is returned on '_payload' key
+        """
+        payload_error = self._payload_error()
+        if payload_error:
+            return {'_payload': payload_error}
+        cache_key = None
+        if self._result_cache is not None and not only_dirty:
+            cache_key = self._result_cache_key(fail_fast)
+            if cache_key is not None:
+                cached = self._result_cache.get(cache_key)
+                if cached is not None:
+                    return self._use_cached_result(*cached)
+        errors = {}
+        max_items = self._max_items
+        for k, v in self._field_items(only_dirty, fail_fast):
+            value = getattr(self, k, None)
+            if max_items is not None and v.repeated and value and len(value) > max_items:
+                error_msg = _items_error(len(value), max_items)
+            else:
+                error_msg = v.validate(value, fail_fast)
             if error_msg:
                 errors[k] = error_msg
+                self._valid_fields.discard(k)
+                if fail_fast:
+                    break
+            else:
+                self._valid_fields.add(k)
+        if self._validators and not (fail_fast and errors):
+            self._run_validators(errors, fail_fast, only_dirty)
+        if cache_key is not None:
+            normalized = {} if errors else self.normalize()
+            # Errors of repeated fields are nested dicts, so the cached ones are a deep copy the caller can't change
+            self._result_cache.set(cache_key, (copy.deepcopy(errors), normalized), time=self._result_cache_time)
+        return errors
+
+    def _result_cache_key(self, fail_fast):
+        cls = type(self)
+        cacheable = cls.__dict__.get('_result_cacheable')
+        if cacheable is None:
+            cacheable = all(f._deterministic and f._memoize_normalize for f in cls._fields.itervalues())
+            cls._result_cacheable = cacheable
+        if not cacheable:
+            return None
+        values = {k: self.__dict__['_' + k] for k in self._fields if '_' + k in self.__dict__}
+        # Schema's etag and validators' names change the key when fields' or validators' configuration changes
+        validators = [name for name, fields in cls._validators]
+        try:
+            payload = json.dumps([cls.__module__, cls.__name__, cls.json_schema_etag(), validators, values,
+                                  str(settings.get_locale()), settings.get_timezone().zone, fail_fast],
+                                 sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return 'gaeforms:%s' % hashlib.md5(payload).hexdigest()
+
+    def _use_cached_result(self, errors, normalized):
+        # Fields are not marked as valid, so cached results never enable trusted population on ModelForm.fill_model
+        self._normalized.update(normalized)
+        return copy.deepcopy(errors)
+
+    def _run_validators(self, errors, fail_fast, only_dirty):
+        for name, fields in self._validators:
+            if not self._valid_fields.issuperset(fields):
+                continue
+            if only_dirty and self._dirty.isdisjoint(fields):
+                continue
+            values = {k: self._normalized_value(k, self._fields[k]) for k in fields}
+            validator_errors = getattr(self, name)(values)
+            if validator_errors:
+                for k in validator_errors:
+                    self._valid_fields.discard(k)
+                errors.update(validator_errors)
+                if fail_fast:
+                    break
+
+    def _payload_chars(self):
+        return _count_chars([getattr(self, k, None) for k in self._fields])
+
+    def _payload_error(self):
+        if self._max_payload_chars is not None:
+            chars = self._payload_chars()
+            if chars > self._max_payload_chars:
+                return _chars_error(chars, self._max_payload_chars)
+
+    def _check_size(self, field_items):
+        """
+        Applies form's _max_payload_chars and _max_items to fields which were not validated
+        :raise InputTooLarge: if some limit is exceeded
+        """
+        error = self._payload_error()
+        if error:
+            raise InputTooLarge(error)
+        max_items = self._max_items
+        if max_items is not None:
+            for k, v in field_items:
+                value = getattr(self, k, None)
+                if v.repeated and value and len(value) > max_items:
+                    raise InputTooLarge(_items_error(len(value), max_items))
+
+    @classmethod
+    def json_schema(cls):
+        """
+        JSON Schema describing form fields. It is built only once per class, so the returned dict must not be changed
+        :return: dict with schema
+        """
+        return cls._schema_and_etag()[0]
+
+    @classmethod
+    def json_schema_etag(cls):
+        """
+        Hash of json_schema content, suitable to be used as a HTTP ETag
+        :return: str
+        """
+        return cls._schema_and_etag()[1]
+
+    @classmethod
+    def _schema_and_etag(cls):
+        cached = cls.__dict__.get('_json_schema_cache')
+        if cached is None:
+            cls._resolve_fields()
+            schema = {'$schema': 'http://json-schema.org/draft-04/schema#',
+                      'title': cls.__name__,
+                      'type': 'object',
+                      'properties': {k: v.schema() for k, v in cls._fields.iteritems()}}
+            required = sorted(k for k, v in cls._fields.iteritems() if v.required and v.default is None)
+            if required:
+                schema['required'] = required
+            etag = hashlib.md5(json.dumps(schema, sort_keys=True)).hexdigest()
+            cached = (schema, etag)
+            cls._json_schema_cache = cached
+        return cached
+
+    @classmethod
+    def normalize_many(cls, payloads):
+        """
+        Validates and normalizes a batch of payloads by column, without building a form per payload.
+        Cross field validators are not run. Payloads exceeding _max_payload_chars or _max_items are not normalized and
+        have only those limits' errors
+        :param payloads: iterable of dicts, like the ones used to fill forms
+        :return: gaeforms.columnar.ColumnarBatch with a column per field, masks of empty values and valid rows and
+        invalid rows' errors
+        :raise InputTooLarge: if there are more than _max_batch_size payloads
+        """
+        payloads = cls._check_batch_size(payloads)
+        cls._resolve_fields()
+        rejected = {}
+        if cls._max_payload_chars is not None or cls._max_items is not None:
+            for i, payload in enumerate(payloads):
+                errors = cls._limit_errors(payload)
+                if errors:
+                    rejected[i] = errors
+        return columnar.normalize_many(cls, payloads, rejected)
+
+    @classmethod
+    def _check_batch_size(cls, payloads):
+        payloads = list(payloads)
+        if cls._max_batch_size is not None and len(payloads) > cls._max_batch_size:
+            raise InputTooLarge(_items_error(len(payloads), cls._max_batch_size))
+        return payloads
+
+    @classmethod
+    def _limit_errors(cls, payload):
+        """
+        Checks a payload against _max_payload_chars and _max_items, as validate does
+        :return: dict with errors. Empty if payload is within limits
+        """
+        if cls._max_payload_chars is not None:
+            chars = _count_chars([payload.get(k) for k in cls._fields])
+            if chars > cls._max_payload_chars:
+                return {'_payload': _chars_error(chars, cls._max_payload_chars)}
+        errors = {}
+        max_items = cls._max_items
+        if max_items is not None:
+            for k, v in cls._fields.iteritems():
+                value = payload.get(k)
+                if v.repeated and value and len(value) > max_items:
+                    errors[k] = _items_error(len(value), max_items)
+        return errors
+
+    @classmethod
+    def validate_many(cls, payloads, fail_fast=False):
+        """
+        Validates a batch of payloads, each one being a dict used to fill a form
+        :param payloads: iterable of dicts
+        :param fail_fast: if True, each payload stops on its first error and the batch stops on first invalid payload
+        :return: dict mapping invalid payloads' indexes to their errors. Empty dict if all payloads are valid
+        :raise InputTooLarge: if there are more than _max_batch_size payloads
+        """
+        payloads = cls._check_batch_size(payloads)
+        errors = {}
+        form = cls()
+        for i, payload in enumerate(payloads):
+            payload_errors = form.refill(**payload).validate(fail_fast=fail_fast)
+            if payload_errors:
+                errors[i] = payload_errors
+                if fail_fast:
+                    break
         return errors
 
     def _normalize_helper(self, key, descriptor):
@@ -483,13 +1377,38 @@ class Form(object):
             return descriptor.default
         return descriptor.normalize(value)
 
-    def normalize(self):
-        return {k: self._normalize_helper(k, v) for k, v in self._fields.iteritems()}
+    def normalize(self, only_dirty=False):
+        """
+        Normalizes form fields. Normalized values are kept until fields are set again, so repeated calls do not
+        normalize them again. Changes made in place, like appending to a list, are not detected
+        :param only_dirty: if True, only fields present on dirty_fields are normalized
+        :return: dict with normalized values. Lists and dicts are copies, so they can be changed by the caller
+        :raise InputTooLarge: if fields which were not validated exceed size limits of form or fields
+        """
+        field_items = list(self._field_items(only_dirty))
+        if not self._valid_fields.issuperset(k for k, v in field_items):
+            self._check_size(field_items)
+        return {k: self._normalized_value(k, v) for k, v in field_items}
+
+    def _normalized_value(self, key, descriptor):
+        try:
+            value = self._normalized[key]
+        except KeyError:
+            value = self._normalize_helper(key, descriptor)
+            if not descriptor._memoize_normalize:
+                return value
+            self._normalized[key] = value
+        # Memoized lists and dicts are copied, so callers changing them do not corrupt the memo or cached results
+        if isinstance(value, (list, dict)):
+            return copy.copy(value)
+        return value
 
     def localize(self, *fields, **obj_values):
         def _localize(k, descriptor):
             value = obj_values.get(k)
-            setattr(self, k, descriptor.localize(value))
+            descriptor._store(self, descriptor.localize(value))
+            self._valid_fields.discard(k)
+            self._normalized.pop(k, None)
             return getattr(self, k)
 
         if fields:
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+from collections import OrderedDict
+import threading
+import time as _time
+
+
+class LRUCache(object):
+    """
+    Thread safe in process cache. Once maxsize is reached, the least recently used entry is evicted.
+    Its get, set and delete methods are compatible with GAE's memcache ones, so both can be used as forms' cache
+    backends
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        """
+        :param maxsize: maximum number of entries
+        :param ttl: seconds an entry lives when set without time. None means entries do not expire
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires <= _time.time():
+                return default
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value, time=0):
+        """
+        Sets a value
+        :param time: seconds the entry lives. 0 means cache's ttl is used
+        """
+        ttl = time or self.ttl
+        expires = _time.time() + ttl if ttl else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
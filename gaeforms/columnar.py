@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Batch normalization by column. Columns are numpy arrays if numpy is installed and lists otherwise
+"""
+from __future__ import absolute_import, unicode_literals
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_FILL_VALUES = {'int64': 0, 'float64': float('nan')}
+
+
+class ColumnarBatch(object):
+    """
+    Normalized payloads stored by column
+
+    columns: dict mapping fields' names to columns. Empty and invalid rows hold None on lists. On numpy arrays they hold
+    0 on int64 columns, NaN on float64 ones, NaT on datetime64 ones and None on object ones
+    nulls: dict mapping fields' names to masks of empty or invalid rows
+    valid: mask of rows without errors
+    errors: dict mapping invalid rows' indexes to dicts with fields' errors, like Form.validate_many
+    """
+
+    def __init__(self, columns, nulls, valid, errors):
+        self.columns = columns
+        self.nulls = nulls
+        self.valid = valid
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.valid)
+
+
+def build_column(values, dtype):
+    """
+    Builds a column from values, None meaning empty rows
+    :param values: list of values
+    :param dtype: numpy dtype name or None for object columns. Values not fitting dtype also give object columns
+    :return: numpy array or values itself if numpy is not installed
+    """
+    if numpy is None:
+        return values
+    if dtype is not None:
+        try:
+            if dtype in _FILL_VALUES:
+                fill_value = _FILL_VALUES[dtype]
+                return numpy.array([fill_value if v is None else v for v in values], dtype=dtype)
+            return numpy.array(values, dtype=dtype)
+        except (OverflowError, ValueError, TypeError):
+            pass
+    column = numpy.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+
+def build_mask(flags):
+    return flags if numpy is None else numpy.array(flags, dtype=bool)
+
+
+def to_ints(strings):
+    """
+    Converts strings made only of digits and an optional sign to integers, all at once if numpy is installed
+    """
+    if numpy is not None and strings:
+        try:
+            return numpy.array(strings).astype(numpy.int64).tolist()
+        except (OverflowError, ValueError):
+            pass
+    return [int(s) for s in strings]
+
+
+def to_floats(strings):
+    """
+    Converts strings with digits, an optional sign and an optional dot to floats, all at once if numpy is installed
+    """
+    if numpy is not None and strings:
+        return numpy.array(strings).astype(numpy.float64).tolist()
+    return [float(s) for s in strings]
+
+
+def to_dates(years, months, days):
+    """
+    Builds dates from digit strings with babel.dates.parse_date rules: two digit years are on 2000s and months
+    greater than 12 are swapped with days. Dates are built all at once if numpy is installed
+    :param years: list of years' digit strings
+    :param months: list of months' digit strings
+    :param days: list of days' digit strings
+    :return: list with dates, None for the ones which do not exist
+    """
+    years = [int(y) + 2000 if len(y) == 2 else int(y) for y in years]
+    months = to_ints(months)
+    days = to_ints(days)
+    if numpy is None or not years:
+        dates = []
+        for year, month, day in zip(years, months, days):
+            if month > 12:
+                month, day = day, month
+            try:
+                dates.append(datetime.date(year, month, day))
+            except ValueError:
+                dates.append(None)
+        return dates
+    years = numpy.array(years, dtype='int64')
+    months = numpy.array(months, dtype='int64')
+    days = numpy.array(days, dtype='int64')
+    swap = months > 12
+    months, days = numpy.where(swap, days, months), numpy.where(swap, months, days)
+    year_months = ((years - 1970) * 12 + months - 1).astype('datetime64[M]')
+    dates = year_months.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')
+    valid = ((years >= datetime.MINYEAR) & (years <= datetime.MAXYEAR) & (months >= 1) & (months <= 12) &
+             (days >= 1) & (dates.astype('datetime64[M]') == year_months))
+    return [date if ok else None for date, ok in zip(dates.tolist(), valid.tolist())]
+
+
+def failing_rows(values, rows, dtype, null_fails, lower, upper, choices):
+    """
+    Finds rows failing required, bounds or choices checks with numpy comparisons over the whole column
+    :param values: column values of rows, None meaning empty
+    :param rows: rows' indexes
+    :param dtype: numpy dtype of values
+    :param null_fails: if True, empty rows fail
+    :param lower: minimum value or None
+    :param upper: maximum value or None
+    :param choices: list of accepted values or None
+    :return: list with failing rows' indexes
+    """
+    nulls = numpy.array([v is None for v in values], dtype=bool)
+    array = numpy.array([0 if v is None else v for v in values], dtype=dtype)
+    failing = nulls.copy() if null_fails else numpy.zeros(len(values), dtype=bool)
+    present = ~nulls
+    if lower is not None:
+        failing |= present & (array < lower)
+    if upper is not None:
+        failing |= present & (array > upper)
+    if choices is not None:
+        failing |= present & ~numpy.in1d(array, numpy.array(choices, dtype=dtype))
+    return numpy.array(rows)[failing].tolist()
+
+
+def normalize_many(form_class, payloads, rejected=None):
+    """
+    Validates and normalizes payloads field by field. Cross field validators are not run
+    :param form_class: Form subclass
+    :param payloads: iterable of dicts, like the ones used to fill forms
+    :param rejected: dict mapping indexes of payloads which must not be normalized to their errors, like form's limits
+    :return: ColumnarBatch
+    """
+    payloads = list(payloads)
+    rejected = rejected or {}
+    form_class._resolve_fields()
+    columns, nulls, errors = {}, {}, {}
+    for k, field in form_class._fields.iteritems():
+        values = [None if i in rejected else payload.get(k) for i, payload in enumerate(payloads)]
+        column, field_errors = field.normalize_column(values)
+        for i, error in field_errors.iteritems():
+            if i not in rejected:
+                errors.setdefault(i, {})[k] = error
+        for i in rejected:
+            column[i] = None
+        columns[k] = build_column(column, None if field.repeated else field.column_dtype)
+        nulls[k] = build_mask([v is None for v in column])
+    errors.update((i, dict(e)) for i, e in rejected.iteritems())
+    valid = build_mask([i not in errors for i in xrange(len(payloads))])
+    return ColumnarBatch(columns, nulls, valid, errors)
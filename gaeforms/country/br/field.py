@@ -3,9 +3,8 @@ from __future__ import absolute_import, unicode_literals
 from itertools import izip
 import operator
 
-from gettext import gettext as _
-
 from gaeforms.base import BaseField
+from gaeforms.i18n import gettext as _
 
 
 def mod11(value):
@@ -42,6 +41,12 @@ class CepField(BaseField):
             return '%s-%s' % (value[:5], value[5:])
         return super(CepField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(CepField, self).schema_field()
+        schema['type'] = 'string'
+        schema['pattern'] = r'^\d{5}-?\d{3}$'
+        return schema
+
 
 class CpfField(BaseField):
     def validate_field(self, value):
@@ -72,6 +77,12 @@ class CpfField(BaseField):
             return '%s.%s.%s-%s' % (value[:3], value[3:6], value[6:9], value[9:11])
         return super(CpfField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(CpfField, self).schema_field()
+        schema['type'] = 'string'
+        schema['pattern'] = r'^\d{3}\.?\d{3}\.?\d{3}-?\d{2}$'
+        return schema
+
     def _calculate_dv(self, value):
         dv1 = mod11(value)
         dv2 = mod11('%s%s' % (value, dv1))
@@ -118,6 +129,12 @@ class CnpjField(BaseField):
             return '%s.%s.%s/%s-%s' % (value[:2], value[2:5], value[5:8], value[8:12], value[12:14])
         return super(CnpjField, self).localize_field(value)
 
+    def schema_field(self):
+        schema = super(CnpjField, self).schema_field()
+        schema['type'] = 'string'
+        schema['pattern'] = r'^\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}$'
+        return schema
+
     @staticmethod
     def __check_digit(number, weights):
         total = sum((int(n) * w for n, w in izip(number, weights)))
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Fixed point conversions between localized strings, Decimals and scaled integers.
+A scaled integer is a number multiplied by 10 ** decimal_places, the way SimpleDecimal stores it on db.
+Rounding is half away from zero and exact for any number of digits.
+"""
+from __future__ import absolute_import, unicode_literals
+from decimal import Decimal
+import re
+
+from babel.numbers import parse_decimal, format_decimal, get_group_symbol, get_decimal_symbol
+
+_SIMPLE_NUMBER = re.compile(r'^\s*([+-]?)([0-9]*)(?:\.([0-9]*))?\s*$')
+
+_locale_specs = {}
+
+# Maximum number of integer digits of converted numbers. Exponents are checked against it before any digit string is
+# built, so inputs like '1E99999999' fail fast
+MAX_INTEGER_DIGITS = 40
+
+
+def _round_digits(sign, int_digits, frac_digits, decimal_places):
+    scaled = int((int_digits + frac_digits[:decimal_places].ljust(decimal_places, '0')) or '0')
+    if frac_digits[decimal_places:decimal_places + 1] >= '5':
+        scaled += 1
+    return -scaled if sign == '-' else scaled
+
+
+def _split_digits(digits, exponent):
+    digits = ''.join(str(d) for d in digits)
+    if exponent >= 0:
+        return digits + '0' * exponent, ''
+    if -exponent >= len(digits):
+        return '', digits.rjust(-exponent, '0')
+    return digits[:exponent], digits[exponent:]
+
+
+def decimal_to_scaled(value, decimal_places):
+    """
+    Converts a Decimal to scaled integer without Decimal arithmetic
+    :param value: Decimal
+    :param decimal_places: number of decimal places kept
+    :return: int
+    """
+    sign, digits, exponent = value.as_tuple()
+    if not isinstance(exponent, (int, long)):
+        raise ValueError('%s can not be converted to integer' % value)
+    if not any(digits) or -exponent > len(digits) + decimal_places:
+        return 0
+    if len(digits) + exponent > MAX_INTEGER_DIGITS:
+        raise ValueError('%s has more than %s integer digits' % (value, MAX_INTEGER_DIGITS))
+    int_digits, frac_digits = _split_digits(digits, exponent)
+    return _round_digits('-' if sign else '', int_digits, frac_digits, decimal_places)
+
+
+def scaled_to_decimal(scaled, decimal_places):
+    """
+    Converts a scaled integer to Decimal. The result is the same, including its exponent, as
+    Decimal(scaled) / 10 ** decimal_places
+    :param scaled: int
+    :param decimal_places: number of decimal places of scaled
+    :return: Decimal
+    """
+    if scaled == 0:
+        return Decimal(0)
+    sign = '-' if scaled < 0 else ''
+    digits = unicode(abs(scaled))
+    stripped = digits.rstrip('0')
+    places = decimal_places - min(len(digits) - len(stripped), decimal_places)
+    digits = digits[:len(digits) - (decimal_places - places)]
+    if places == 0:
+        return Decimal(sign + digits)
+    digits = digits.rjust(places + 1, '0')
+    return Decimal('%s%s.%s' % (sign, digits[:-places], digits[-places:]))
+
+
+def _locale_spec(locale):
+    key = str(locale)
+    spec = _locale_specs.get(key)
+    if spec is None:
+        pattern = locale.decimal_formats.get(None)
+        simple_pattern = (pattern is not None and
+                          not pattern.exp_prec and
+                          '@' not in pattern.pattern and
+                          not getattr(pattern, 'scale', 0) and
+                          pattern.int_prec[0] == 1 and
+                          pattern.frac_prec[0] == 0)
+        format_spec = None
+        if simple_pattern:
+            format_spec = (pattern.prefix[0], pattern.suffix[0], pattern.grouping, pattern.frac_prec[1])
+        spec = (get_group_symbol(locale), get_decimal_symbol(locale), format_spec)
+        _locale_specs[key] = spec
+    return spec
+
+
+def parse_scaled(string, decimal_places, locale):
+    """
+    Parses a localized number string to scaled integer. Strings not in plain digits format, like exponents, are
+    parsed by babel
+    :param string: localized number
+    :param decimal_places: number of decimal places kept
+    :param locale: babel Locale
+    :return: int
+    """
+    group_symbol, decimal_symbol, format_spec = _locale_spec(locale)
+    if group_symbol == '\xa0' and group_symbol not in string and ' ' in string:
+        string = string.replace(' ', group_symbol)
+    match = _SIMPLE_NUMBER.match(string.replace(group_symbol, '').replace(decimal_symbol, '.'))
+    if match:
+        sign, int_digits, frac_digits = match.groups()
+        frac_digits = frac_digits or ''
+        if int_digits or frac_digits:
+            return _round_digits(sign, int_digits, frac_digits, decimal_places)
+    return decimal_to_scaled(parse_decimal(string, locale=locale), decimal_places)
+
+
+def plain_to_scaled(string, decimal_places):
+    """
+    Converts a number string made of digits, an optional sign and an optional dot, without locale symbols, to scaled
+    integer
+    :param string: plain number
+    :param decimal_places: number of decimal places kept
+    :return: int
+    """
+    match = _SIMPLE_NUMBER.match(string)
+    if not match:
+        raise ValueError('%s is not a plain number' % string)
+    sign, int_digits, frac_digits = match.groups()
+    return _round_digits(sign, int_digits, frac_digits or '', decimal_places)
+
+
+def format_fixed(value, locale):
+    """
+    Formats a Decimal using locale's decimal pattern, the same way babel.numbers.format_decimal does.
+    Values needing rounding, negative ones and uncommon locale patterns are formatted by babel
+    :param value: Decimal
+    :param locale: babel Locale
+    :return: localized string
+    """
+    group_symbol, decimal_symbol, format_spec = _locale_spec(locale)
+    if format_spec is None or not isinstance(value, Decimal):
+        return format_decimal(value, locale=locale)
+    sign, digits, exponent = value.as_tuple()
+    prefix, suffix, grouping, max_frac = format_spec
+    if (sign or not isinstance(exponent, (int, long)) or len(digits) + exponent > MAX_INTEGER_DIGITS or
+            -exponent > len(digits) + max_frac):
+        return format_decimal(value, locale=locale)
+    int_digits, frac_digits = _split_digits(digits, exponent)
+    frac_digits = frac_digits.rstrip('0')
+    if len(frac_digits) > max_frac:
+        return format_decimal(value, locale=locale)
+    int_digits = int_digits.lstrip('0') or '0'
+    group_size = grouping[0]
+    grouped = ''
+    while len(int_digits) > group_size:
+        grouped = group_symbol + int_digits[-group_size:] + grouped
+        int_digits = int_digits[:-group_size]
+        group_size = grouping[1]
+    number = int_digits + grouped
+    if frac_digits:
+        number += decimal_symbol + frac_digits
+    return prefix + number + suffix
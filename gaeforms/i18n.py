@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Translation of forms' messages using catalogs from locale directory, shipped inside the package.
+Each catalog is read once and kept as a dict, so translating is a lookup keyed by current locale
+"""
+from __future__ import absolute_import, unicode_literals
+import os
+import threading
+
+from babel.messages.mofile import read_mo
+from babel.messages.pofile import read_po
+
+from gaeforms import settings
+
+locale_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locale')
+domain = 'messages'
+
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def _read_catalog(locale_name):
+    """
+    Reads locale's compiled .mo catalog, or its .po one if it was not compiled
+    """
+    path = os.path.join(locale_dir, locale_name, 'LC_MESSAGES', domain)
+    if os.path.exists(path + '.mo'):
+        with open(path + '.mo', 'rb') as mo_file:
+            catalog = read_mo(mo_file)
+    elif os.path.exists(path + '.po'):
+        with open(path + '.po', 'rb') as po_file:
+            catalog = read_po(po_file, locale=locale_name)
+    else:
+        return None
+    return {message.id: message.string for message in catalog
+            if message.id and message.string and not message.fuzzy and not message.pluralizable}
+
+
+def get_catalog(locale):
+    """
+    Gets translations for a locale. If there is no catalog for locale's territory, language's one is used
+    :param locale: babel Locale
+    :return: dict mapping messages to their translations
+    """
+    key = str(locale)
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        with _lock:
+            catalog = _catalogs.get(key)
+            if catalog is None:
+                catalog = _read_catalog(key)
+                if catalog is None and key != locale.language:
+                    catalog = _read_catalog(locale.language)
+                catalog = catalog or {}
+                _catalogs[key] = catalog
+    return catalog
+
+
+def clear_catalogs():
+    """
+    Discards loaded catalogs, so they are read again on next use. Useful after changing locale_dir
+    """
+    with _lock:
+        _catalogs.clear()
+
+
+def gettext(message):
+    """
+    Translates message to locale returned by settings.get_locale
+    :param message: message id
+    :return: translated message or message itself if there is no translation
+    """
+    return get_catalog(settings.get_locale()).get(message, message)
@@ -1,32 +1,81 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
+import copy
+import hashlib
+import json
+import threading
+import time
+import uuid
+
 from google.appengine.ext.ndb.model import IntegerProperty, StringProperty, DateTimeProperty, DateProperty, \
-    FloatProperty, TextProperty, BooleanProperty, KeyProperty
-from gaeforms.base import IntegerField, Form, _FormMetaclass, DecimalField, StringField, DateField, DateTimeField, \
-    FloatField, EmailField, BooleanField, KeyField
+    FloatProperty, TextProperty, BooleanProperty, KeyProperty, TimeProperty, StructuredProperty, \
+    LocalStructuredProperty, Model
+from gaeforms.base import IntegerField, Form, _FormMetaclass, _sort_by_cost, _option, DecimalField, StringField, \
+    DateField, DateTimeField, FloatField, EmailField, BooleanField, KeyField, BaseField
+from gaeforms import settings
+from gaeforms.cache import LRUCache
+from gaeforms.i18n import gettext as _
+from gaeforms.pool import FormPool
 from gaeforms.ndb.property import IntegerBounded, SimpleDecimal, SimpleCurrency, FloatBounded, Email, StringBounded
 
 _property_to_field_dct = {}
+_resolved_field_dct = {}
+# Properties whose validation is fully done by their fields. They are populated without validation after forms'
+# validation
+_trusted_properties = set()
+# ModelForm classes built by modelform_for
+modelform_cache = LRUCache(maxsize=256)
 
 
-def registry(property_cls, field_cls):
+def registry(property_cls, field_cls, trusted=False):
+    """
+    Registers the field class used on ModelForms for a property class and its subclasses.
+    A None field class marks the property as not supported, even if one of its ancestors is registered
+    :param trusted: if True, field validation covers all property validation. So property validation is skipped when
+    populating models with values already validated by form. It applies only to property_cls, not to its subclasses
+    """
     _property_to_field_dct[property_cls] = field_cls
+    if trusted:
+        _trusted_properties.add(property_cls)
+    else:
+        _trusted_properties.discard(property_cls)
+    _resolved_field_dct.clear()
+    modelform_cache.clear()
 
 
-registry(IntegerProperty, IntegerField)
-registry(IntegerBounded, IntegerField)
-registry(SimpleDecimal, DecimalField)
-registry(SimpleCurrency, DecimalField)
+def field_class_for(property_cls):
+    """
+    Finds the field class registered for a property class or for its closest ancestor. Results are cached until
+    registry is called again
+    :param property_cls: property class
+    :return: field class or None if property is not registered
+    """
+    try:
+        return _resolved_field_dct[property_cls]
+    except KeyError:
+        field_cls = next((_property_to_field_dct[c] for c in property_cls.__mro__ if c in _property_to_field_dct),
+                         None)
+        _resolved_field_dct[property_cls] = field_cls
+        return field_cls
+
+
+registry(IntegerProperty, IntegerField, trusted=True)
+registry(IntegerBounded, IntegerField, trusted=True)
+registry(SimpleDecimal, DecimalField, trusted=True)
+registry(SimpleCurrency, DecimalField, trusted=True)
 registry(StringProperty, StringField)
 registry(TextProperty, StringField)
 registry(DateTimeProperty, DateTimeField)
-registry(DateProperty, DateField)
-registry(FloatProperty, FloatField)
+registry(DateProperty, DateField, trusted=True)
+registry(FloatProperty, FloatField, trusted=True)
+# FloatField does not check FloatBounded limits, so its validation is still needed
 registry(FloatBounded, FloatField)
 registry(Email, EmailField)
-registry(BooleanProperty, BooleanField)
+registry(BooleanProperty, BooleanField, trusted=True)
 registry(KeyProperty, KeyField)
-registry(StringBounded,StringField)
+registry(StringBounded, StringField)
+# TimeProperty inherits from DateTimeProperty, but its values are times
+registry(TimeProperty, None)
 
 
 class NotRegisteredProperty(Exception):
@@ -39,7 +88,7 @@ class InvalidParams(Exception):
 
 def extract_names(properties):
     if properties:
-        return set(p._code_name for p in properties)
+        return set(p if isinstance(p, basestring) else p._code_name for p in properties)
 
 
 def make_include_function(include, exclude):
@@ -59,28 +108,139 @@ def make_include_function(include, exclude):
     return should_include
 
 
+def build_fields(class_name, model_class, should_include, attrs):
+    fields = {}
+    for k, v in model_class._properties.iteritems():
+        if should_include(k) and k not in attrs:
+            field_class = field_class_for(v.__class__)
+
+            if field_class is None:
+                msg = 'The %s attribute from class %s has a property not registered: %s' % \
+                      (k, class_name, v.__class__)
+                raise NotRegisteredProperty(msg)
+            field = field_class()
+            field.set_options(v)
+            fields[k] = field
+    return fields
+
+
+def trusted_names(model_class, fields):
+    """
+    Names of fields built from trusted properties without custom validators
+    :param model_class: model class
+    :param fields: dict of fields built by build_fields
+    :return: frozenset
+    """
+    return frozenset(k for k in fields
+                     if type(model_class._properties[k]) in _trusted_properties and
+                     model_class._properties[k]._validator is None)
+
+
+_form_timings = {}
+_lazy_lock = threading.Lock()
+# Backends of ModelForms' _localized_cache by model kind, used to invalidate entities for all forms over a model
+_localized_caches = {}
+
+
+def _register_localized_cache(model_class, cache):
+    caches = _localized_caches.setdefault(model_class._get_kind(), [])
+    if not any(c is cache for c in caches):
+        caches.append(cache)
+
+
+def _generation_key(key):
+    return 'gaeforms:gen:%s' % key.urlsafe()
+
+
+def invalidate_localized(key):
+    """
+    Discards fill_with_model results cached for an entity by every ModelForm of its model, on all locales and
+    timezones. It must be called after the entity is written
+    :param key: entity's key
+    """
+    generation_key = _generation_key(key)
+    for cache in _localized_caches.get(key.kind(), ()):
+        cache.set(generation_key, uuid.uuid4().hex)
+
+
+class LocalizedCacheInvalidation(object):
+    """
+    Model mixin calling invalidate_localized after each put, so forms caching fill_with_model results never
+    return the entity's previous values. Inside transactions, put happens only on commit, so invalidate_localized
+    must be called again after it
+    """
+
+    def _post_put_hook(self, future):
+        super(LocalizedCacheInvalidation, self)._post_put_hook(future)
+        if future.get_exception() is None:
+            invalidate_localized(future.get_result())
+
+
+def timing_report():
+    """
+    Report of time spent building ModelForms fields, most expensive first. Phase is 'import' for fields built on class
+    creation and 'first use' for fields built lazily
+    :return: list of tuples (form name, phase, seconds)
+    """
+    report = [(name, phase, seconds) for (name, phase), seconds in _form_timings.iteritems()]
+    return sorted(report, key=lambda record: record[2], reverse=True)
+
+
+def _record_timing(cls, phase, start):
+    _form_timings[('%s.%s' % (cls.__module__, cls.__name__), phase)] = time.time() - start
+
+
 class _ModelFormMetaclass(_FormMetaclass):
     def __new__(cls, class_to_be_created_name, bases, attrs):
+        start = time.time()
         model_class = attrs.get('_model_class')
+        lazy = attrs.get('_lazy', any(getattr(b, '_lazy', False) for b in bases))
         if model_class:
-            properties = model_class._properties
             include = extract_names(attrs.get('_include'))
             exclude = extract_names(attrs.get('_exclude'))
 
             should_include = make_include_function(include, exclude)
+            if lazy:
+                attrs['_pending_fields'] = (model_class, should_include)
+            else:
+                fields = build_fields(class_to_be_created_name, model_class, should_include, attrs)
+                attrs.update(fields)
+                attrs['_trusted_fields'] = trusted_names(model_class, fields)
+        new_cls = super(_ModelFormMetaclass, cls).__new__(cls, class_to_be_created_name, bases, attrs)
+        if model_class:
+            if new_cls._localized_cache is not None:
+                _register_localized_cache(model_class, new_cls._localized_cache)
+            _record_timing(new_cls, 'import', start)
+        return new_cls
 
-            for k, v in properties.iteritems():
-                if should_include(k) and k not in attrs:
-                    field_class = _property_to_field_dct.get(v.__class__, None)
+    @classmethod
+    def _field_names(mcs, attrs):
+        names = super(_ModelFormMetaclass, mcs)._field_names(attrs)
+        pending = attrs.get('_pending_fields')
+        if pending is None:
+            return names
+        model_class, should_include = pending
+        return set(names).union(k for k in model_class._properties if should_include(k))
 
-                    if field_class is None:
-                        msg = 'The %s attribute from class %s has a property not registered: %s' % \
-                              (k, class_to_be_created_name, v.__class__)
-                        raise NotRegisteredProperty(msg)
-                    field = field_class()
-                    field.set_options(v)
-                    attrs[k] = field
-        return super(_ModelFormMetaclass, cls).__new__(cls, class_to_be_created_name, bases, attrs)
+
+def populate_trusted(model, values, trusted):
+    """
+    Populates model as Model.populate does, but skips validation of trusted properties.
+    It must be used only with values already validated by a form
+    :param model: model to be populated
+    :param values: dict of properties' names and their normalized values
+    :param trusted: names of properties populated without validation, like ModelForm._trusted_fields
+    """
+    if model._projection:
+        model.populate(**values)
+        return
+    model_class = type(model)
+    for name, value in values.iteritems():
+        if name in trusted:
+            prop = getattr(model_class, name)
+            prop._store_value(model, list(value) if prop._repeated else value)
+        else:
+            model.populate(**{name: value})
 
 
 class ModelFormSecurityError(Exception):
@@ -95,31 +255,255 @@ class ModelForm(Form):
     _model_class = None
     _include = None
     _exclude = None
+    # If True, fields are built from model properties only when form class is first used instead of on its creation
+    _lazy = False
+    _pending_fields = None
+    # Names of fields built from trusted properties. Declared fields are never trusted
+    _trusted_fields = frozenset()
+    # Backend caching fill_with_model results, like LRUCache or GAE's memcache. None disables the cache
+    _localized_cache = None
+    # Seconds cached localized dicts live. 0 means backend's default, like LRUCache's ttl
+    _localized_cache_time = 0
+    # Name of model property changed on every update, like a DateTimeProperty with auto_now, used on cache key
+    _version_property = None
+
+    @classmethod
+    def _resolve_fields(cls):
+        if cls.__dict__.get('_pending_fields') is None:
+            return
+        with _lazy_lock:
+            pending = cls.__dict__.get('_pending_fields')
+            if pending is None:
+                return
+            start = time.time()
+            model_class, should_include = pending
+            new_fields = build_fields(cls.__name__, model_class, should_include, cls.__dict__)
+            for k, field in new_fields.iteritems():
+                field._set_attr_name(k)
+                setattr(cls, k, field)
+            fields = dict(cls._fields)
+            fields.update(new_fields)
+            cls._fields = fields
+            cls._fields_by_cost = _sort_by_cost(fields.iteritems())
+            cls._trusted_fields = cls.__dict__.get('_trusted_fields', frozenset()) | trusted_names(model_class,
+                                                                                                   new_fields)
+            cls._pending_fields = None
+            _record_timing(cls, 'first use', start)
 
-    def fill_model(self, model=None):
+    def fill_model(self, model=None, only_dirty=False):
         """
         Populates a model with normalized properties. If no model is provided (None) a new one will be created.
+        If fields were validated without errors since their last change, trusted properties' validation is skipped
         :param model: model to be populade
+        :param only_dirty: if True, only fields present on dirty_fields are normalized and populated.
+        Useful for partial updates
         :return: populated model
         """
-        normalized_dct = self.normalize()
+        normalized_dct = self.normalize(only_dirty)
+        trusted = type(self).__dict__.get('_trusted_fields') if self._valid_fields.issuperset(normalized_dct) else None
         if model:
             if not isinstance(model, self._model_class):
                 raise ModelFormSecurityError('%s should be %s instance' % (model, self._model_class.__name__))
+        elif trusted:
+            model = self._model_class()
+        else:
+            return self._model_class(**normalized_dct)
+        if trusted:
+            populate_trusted(model, normalized_dct, trusted)
+        else:
             model.populate(**normalized_dct)
-            return model
-        return self._model_class(**normalized_dct)
+        return model
 
     def fill_with_model(self, model, *fields):
         """
         Populates this form with localized properties from model.
+        If _localized_cache is set, results for saved models are cached by form schema, key, _version_property, locale,
+        timezone and fields. They are discarded by invalidate_localized, which must be called after the entity is
+        written, or by changes of _version_property
         :param fields: string list indicating the fields to include. If None, all fields defined on form will be used
         :param model: model
         :return: dict with localized properties
         """
+        cache_key = None
+        if self._localized_cache is not None and model.key:
+            cache_key = self._localized_cache_key(model, fields)
+            cached = self._localized_cache.get(cache_key)
+            if cached is not None:
+                # Cached dicts are copied, so changing the result or this form's values does not change the cache
+                localized_dct = copy.deepcopy(cached)
+                for k, v in localized_dct.iteritems():
+                    if k in self._fields:
+                        self._fields[k]._store(self, v)
+                        self._valid_fields.discard(k)
+                        self._normalized.pop(k, None)
+                return localized_dct
         model_dct = model.to_dict(include=self._fields.keys())
         localized_dct = self.localize(*fields, **model_dct)
         if model.key:
             localized_dct['id'] = model.key.id()
+        if cache_key is not None:
+            self._localized_cache.set(cache_key, copy.deepcopy(localized_dct), time=self._localized_cache_time)
         return localized_dct
 
+    @classmethod
+    def invalidate_localized(cls, key):
+        """
+        Discards fill_with_model results cached for an entity by this and every other ModelForm of its model.
+        See gaeforms.ndb.form.invalidate_localized
+        :param key: entity's key
+        """
+        _register_localized_cache(cls._model_class, cls._localized_cache)
+        invalidate_localized(key)
+
+    def _localized_cache_key(self, model, fields):
+        _register_localized_cache(self._model_class, self._localized_cache)
+        generation_key = _generation_key(model.key)
+        generation = self._localized_cache.get(generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self._localized_cache.set(generation_key, generation)
+        cls = type(self)
+        version = getattr(model, self._version_property) if self._version_property else None
+        # Schema's etag changes the key when fields change, e.g. after a deploy, since cached dicts may never expire
+        payload = json.dumps(['%s.%s' % (cls.__module__, cls.__name__), cls.json_schema_etag(), generation,
+                              unicode(version), str(settings.get_locale()), settings.get_timezone().zone,
+                              sorted(fields)])
+        return 'gaeforms:localized:%s' % hashlib.md5(payload).hexdigest()
+
+    @classmethod
+    def localize_for_locales(cls, models, locales, timezones=None, fields=()):
+        """
+        Localizes models for several locales. Each model's values are extracted only once and localized with cached
+        per locale formats
+        :param models: a model or a list of models
+        :param locales: list of locale names
+        :param timezones: list of timezone names, one for each locale. If None, timezone from settings is used
+        :param fields: names of fields to include. If empty, all fields defined on form will be used
+        :return: list with a localized dict per locale. If models is a list, a list of those lists, one per model
+        """
+        if timezones is None:
+            timezones = [None] * len(locales)
+        elif len(timezones) != len(locales):
+            raise InvalidParams('timezones must have one element for each locale')
+        if isinstance(models, Model):
+            return cls.localize_for_locales([models], locales, timezones, fields)[0]
+        form = cls()
+        include = cls._fields.keys()
+        results = []
+        for model in models:
+            model_dct = model.to_dict(include=include)
+            model_id = model.key.id() if model.key else None
+            localized = []
+            for locale, timezone in zip(locales, timezones):
+                with settings.override(locale, timezone):
+                    localized_dct = form.localize(*fields, **model_dct)
+                if model_id is not None:
+                    localized_dct['id'] = model_id
+                localized.append(localized_dct)
+            results.append(localized)
+        return results
+
+
+def modelform_for(model_class, include=None, exclude=None):
+    """
+    Builds a ModelForm class for a model. Classes are cached by model, include and exclude, so calls with same
+    arguments return the same class
+    :param model_class: model class
+    :param include: properties, or their names, to be included on form
+    :param exclude: properties, or their names, to be excluded from form
+    :return: ModelForm subclass
+    """
+    include = extract_names(include)
+    exclude = extract_names(exclude)
+    cache_key = (model_class,
+                 None if include is None else frozenset(include),
+                 None if exclude is None else frozenset(exclude))
+    form_class = modelform_cache.get(cache_key)
+    if form_class is None:
+        form_class = _ModelFormMetaclass(str('%sForm' % model_class.__name__),
+                                         (ModelForm,),
+                                         {'__module__': __name__,
+                                          '_model_class': model_class,
+                                          '_include': include,
+                                          '_exclude': exclude})
+        modelform_cache.set(cache_key, form_class)
+    return form_class
+
+
+def _pool_for(form_class):
+    """
+    Pool of forms used by StructuredField to process sub entities. It is kept on form class, so it lives as long as
+    the class, e.g. until modelform_cache evicts it
+    """
+    pool = form_class.__dict__.get('_form_pool')
+    if pool is None:
+        pool = FormPool(form_class)
+        form_class._form_pool = pool
+    return pool
+
+
+class StructuredField(BaseField):
+    """
+    Field for sub entities of StructuredProperty and LocalStructuredProperty. Values are dicts validated, normalized
+    and localized by sub model's ModelForm, or by form_class if provided. Form instances are pooled, so repeated values
+    are processed by the same few forms
+    """
+    _cost = 4
+    # Normalized values are models, which must not be shared by different parent models
+    _memoize_normalize = False
+
+    model_class = _option('model_class')
+    form_class = _option('form_class')
+
+    def __init__(self, model_class=None, form_class=None, required=False, default=None, repeated=False,
+                 choices=None):
+        super(StructuredField, self).__init__(required, default, repeated, choices)
+        self._options = self._options.replace(model_class=model_class, form_class=form_class)
+
+    def set_options(self, model_property):
+        super(StructuredField, self).set_options(model_property)
+        self.model_class = model_property._modelclass
+
+    def _sub_form_class(self):
+        return self.form_class or modelform_for(self.model_class)
+
+    def _sub_form(self, value):
+        return _pool_for(self._sub_form_class()).form(**value)
+
+    def _validate_one(self, value, fail_fast):
+        if isinstance(value, dict):
+            with self._sub_form(value) as form:
+                return form.validate(fail_fast) or None
+        return super(StructuredField, self)._validate_one(value, fail_fast)
+
+    def validate_field(self, value):
+        if isinstance(value, dict):
+            return self._validate_one(value, False)
+        if value is None or value == '' or isinstance(value, Model):
+            return super(StructuredField, self).validate_field(value)
+        return _('Invalid value')
+
+    def normalize_field(self, value):
+        if isinstance(value, dict):
+            with self._sub_form(value) as form:
+                return form.fill_model()
+        if value == '':
+            value = None
+        return super(StructuredField, self).normalize_field(value)
+
+    def localize_field(self, value):
+        if isinstance(value, Model):
+            value = value.to_dict()
+        if isinstance(value, dict):
+            with _pool_for(self._sub_form_class()).form() as form:
+                return form.localize(**value)
+        return super(StructuredField, self).localize_field(value)
+
+    def schema_field(self):
+        schema = dict(self._sub_form_class().json_schema())
+        del schema['$schema']
+        return schema
+
+
+registry(StructuredProperty, StructuredField)
+registry(LocalStructuredProperty, StructuredField)
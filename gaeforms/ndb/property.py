@@ -4,6 +4,7 @@ from decimal import Decimal
 import re
 from google.appengine.ext import ndb
 from google.appengine.ext.ndb.model import IntegerProperty, _MAX_STRING_LENGTH
+from gaeforms.fixedpoint import decimal_to_scaled, scaled_to_decimal
 
 
 class BoundaryError(Exception):
@@ -87,7 +88,6 @@ class SimpleDecimal(IntegerProperty):
 
     def __init__(self, decimal_places=2, lower=None, upper=None, **kwargs):
         self.decimal_places = decimal_places
-        self.__multipler = (10 ** self.decimal_places)
         self.lower = lower and self._from_base_type(self._to_base_type(lower))
         self.upper = upper and self._from_base_type(self._to_base_type(upper))
         super(SimpleDecimal, self).__init__(**kwargs)
@@ -101,10 +101,14 @@ class SimpleDecimal(IntegerProperty):
         return value
 
     def _to_base_type(self, value):
-        return int(round(Decimal(value) * self.__multipler))
+        if isinstance(value, Decimal):
+            return decimal_to_scaled(value, self.decimal_places)
+        if isinstance(value, (int, long)):
+            return value * (10 ** self.decimal_places)
+        return decimal_to_scaled(Decimal(value), self.decimal_places)
 
     def _from_base_type(self, value):
-        return Decimal(value) / self.__multipler
+        return scaled_to_decimal(value, self.decimal_places)
 
 
 class SimpleCurrency(SimpleDecimal):
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+from contextlib import contextmanager
+import threading
+
+
+class FormPool(object):
+    """
+    Keeps released form instances to be reused through Form.refill instead of building new ones on every request
+    """
+
+    def __init__(self, form_class, maxsize=16):
+        self.form_class = form_class
+        self.maxsize = maxsize
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, **kwargs):
+        """
+        Gets a form filled with kwargs, reusing a released one if available
+        :return: form instance
+        """
+        with self._lock:
+            form = self._free.pop() if self._free else None
+        if form is None:
+            return self.form_class(**kwargs)
+        return form.refill(**kwargs)
+
+    def release(self, form):
+        """
+        Gives form back to pool. It must not be used by caller after that
+        """
+        form.reset()
+        with self._lock:
+            if len(self._free) < self.maxsize:
+                self._free.append(form)
+
+    @contextmanager
+    def form(self, **kwargs):
+        """
+        Context manager acquiring a form and releasing it on exit
+        """
+        form = self.acquire(**kwargs)
+        try:
+            yield form
+        finally:
+            self.release(form)
+
+    def __len__(self):
+        return len(self._free)
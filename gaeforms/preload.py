@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import datetime
+import time
+
+import babel
+from babel import dates
+from babel.numbers import format_decimal, parse_decimal
+
+from gaeforms import settings, i18n
+from gaeforms.base import DateFieldMixin
+from gaeforms.fixedpoint import _locale_spec
+
+_SAMPLE_DATETIME = datetime.datetime(2016, 12, 25, 18, 0, 0)
+
+
+def _form_classes(forms):
+    """
+    Yields forms and forms used by their fields, like StructuredField sub forms, each one only once
+    """
+    seen = set()
+    pending = list(forms)
+    while pending:
+        form_class = pending.pop(0)
+        if form_class in seen:
+            continue
+        seen.add(form_class)
+        yield form_class
+        form_class._resolve_fields()
+        for field in form_class._fields.itervalues():
+            sub_form_class = getattr(field, '_sub_form_class', None)
+            if sub_form_class is not None:
+                pending.append(sub_form_class())
+
+
+def _warm_form(form_class):
+    form_class._resolve_fields()
+    form_class.json_schema()
+
+
+def _warm_locale(name, date_fields):
+    locale = babel.Locale.parse(name)
+    format_decimal(parse_decimal('1', locale=locale), locale=locale)
+    _locale_spec(locale)
+    i18n.get_catalog(locale)
+    for field in date_fields:
+        pattern = field.get_date_format(locale)
+        dates.format_datetime(_SAMPLE_DATETIME, '%s %s' % (pattern, field.get_time_format()), locale=locale)
+
+
+def _warm_timezone(name):
+    dates.get_timezone(name).normalize(dates.UTC.localize(_SAMPLE_DATETIME))
+
+
+def warmup(locales=None, timezones=None, forms=None):
+    """
+    Loads babel locale data and translation catalogs, compiles date and number patterns and builds lazy form
+    structures, so the first request does not pay for them. Suitable to be called on GAE /_ah/warmup handler
+    :param locales: locale names. If None, locale from settings is used
+    :param timezones: timezone names. If None, timezone from settings is used
+    :param forms: Form classes to be warmed
+    :return: list of tuples (kind, name, seconds) in warming order. Kind is 'form', 'locale' or 'timezone'
+    """
+    report = []
+
+    def timed(kind, name, fcn, *args):
+        start = time.time()
+        fcn(*args)
+        report.append((kind, name, time.time() - start))
+
+    date_fields = []
+    for form_class in _form_classes(forms or ()):
+        timed('form', '%s.%s' % (form_class.__module__, form_class.__name__), _warm_form, form_class)
+        date_fields.extend(f for f in form_class._fields.itervalues() if isinstance(f, DateFieldMixin))
+    for name in locales or [settings._get_locale()]:
+        timed('locale', name, _warm_locale, name, date_fields)
+    for name in timezones or [settings._get_tz()]:
+        timed('timezone', name, _warm_timezone, name)
+    return report
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Diagnostic mode reporting memory allocated by forms' operations and fields' methods.
+It needs tracemalloc, available on Python 3 and on Python 2 builds patched with pytracemalloc.
+Methods are patched on classes while any thread is profiling. Each report records only calls made on the thread which
+created it, but tracemalloc counts memory of the whole process, so allocations of other threads can show up on it
+"""
+from __future__ import absolute_import, unicode_literals
+from contextlib import contextmanager
+from functools import wraps
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from gaeforms.base import Form, BaseField
+from gaeforms.ndb.form import ModelForm
+
+_FORM_METHODS = ((Form, 'validate'), (Form, 'normalize'), (Form, 'localize'), (ModelForm, 'fill_model'),
+                 (ModelForm, 'fill_with_model'))
+_FIELD_METHODS = ((BaseField, 'validate'), (BaseField, 'normalize'), (BaseField, 'localize'))
+
+# Guards patching. Methods are patched when first session starts and restored when last one ends
+_lock = threading.Lock()
+_sessions = 0
+_originals = []
+_started_tracing = False
+# Reports and stack of measured calls of current thread
+_local = threading.local()
+
+
+class ProfilingNotAvailable(Exception):
+    pass
+
+
+class AllocationReport(object):
+    """
+    Allocations by form operation, like 'UserForm.validate', and by field method, like 'IntegerField.normalize'
+    """
+
+    def __init__(self):
+        self._records = {}
+
+    def _record(self, kind, name, allocated, peak):
+        record = self._records.setdefault((kind, name), [0, 0, 0])
+        record[0] += 1
+        record[1] += allocated
+        record[2] = max(record[2], peak)
+
+    def rows(self, kind=None):
+        """
+        Report rows, biggest peak first
+        :param kind: 'form' or 'field' to filter rows. None returns all rows
+        :return: list of tuples (kind, name, calls, bytes kept allocated, peak bytes)
+        """
+        rows = [(k, name, calls, allocated, peak) for (k, name), (calls, allocated, peak) in self._records.iteritems()
+                if kind is None or k == kind]
+        return sorted(rows, key=lambda row: row[4], reverse=True)
+
+
+def _thread_state():
+    try:
+        return _local.reports, _local.stack
+    except AttributeError:
+        _local.reports, _local.stack = [], []
+        return _local.reports, _local.stack
+
+
+def _enter(stack):
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        stack[-1][1] = max(stack[-1][1], peak)
+    reset_peak = getattr(tracemalloc, 'reset_peak', None)
+    # Peak is process wide, so it is reset only if no other session relies on it
+    if reset_peak is not None and _sessions == 1:
+        reset_peak()
+    stack.append([current, current])
+
+
+def _exit(reports, stack, kind, name):
+    current, peak = tracemalloc.get_traced_memory()
+    start, frame_peak = stack.pop()
+    frame_peak = max(frame_peak, peak)
+    if stack:
+        stack[-1][1] = max(stack[-1][1], frame_peak)
+    for report in reports:
+        report._record(kind, name, current - start, frame_peak - start)
+
+
+def _wrap(kind, method):
+    @wraps(method)
+    def wrapper(obj, *args, **kwargs):
+        reports, stack = _thread_state()
+        if not reports:
+            return method(obj, *args, **kwargs)
+        _enter(stack)
+        try:
+            return method(obj, *args, **kwargs)
+        finally:
+            _exit(reports, stack, kind, '%s.%s' % (type(obj).__name__, method.__name__))
+
+    return wrapper
+
+
+def _patch():
+    global _started_tracing
+    for kind, methods in (('form', _FORM_METHODS), ('field', _FIELD_METHODS)):
+        for cls, name in methods:
+            method = cls.__dict__[name]
+            _originals.append((cls, name, method))
+            setattr(cls, name, _wrap(kind, method))
+    _started_tracing = not tracemalloc.is_tracing()
+    if _started_tracing:
+        tracemalloc.start()
+
+
+def _unpatch():
+    if _started_tracing:
+        tracemalloc.stop()
+    for cls, name, method in _originals:
+        setattr(cls, name, method)
+    del _originals[:]
+
+
+@contextmanager
+def profile_allocations():
+    """
+    Context manager measuring memory allocated by forms and fields on current thread while it is active. It can be
+    used by several threads, or nested, at same time. Peaks are exact only if tracemalloc has reset_peak (Python 3.9+)
+    and no other session is active. Otherwise they are upper bounds
+    :return: AllocationReport, filled when context exits
+    """
+    global _sessions
+    if tracemalloc is None:
+        raise ProfilingNotAvailable('tracemalloc module is needed for allocation profiling')
+    report = AllocationReport()
+    with _lock:
+        if _sessions == 0:
+            _patch()
+        _sessions += 1
+    reports, stack = _thread_state()
+    reports.append(report)
+    try:
+        yield report
+    finally:
+        reports.remove(report)
+        with _lock:
+            _sessions -= 1
+            if _sessions == 0:
+                _unpatch()
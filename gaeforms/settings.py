@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+from contextlib import contextmanager
+import threading
+
 import babel
 from babel import dates
 
+_overrides = threading.local()
+# babel.Locale instances by name, so locale data is parsed only once per locale
+_locales = {}
+
 
 def _get_locale():
     return 'en_US'
@@ -43,12 +50,38 @@ def tz_factory(factory):
     return factory
 
 
+@contextmanager
+def override(locale=None, timezone=None):
+    """
+    Context manager which makes get_locale and get_timezone return the given locale and timezone on current thread,
+    instead of factories' ones. None keeps the current value
+
+    :param locale: str with locale
+    :param timezone: str with timezone
+    """
+    previous = (getattr(_overrides, 'locale', None), getattr(_overrides, 'timezone', None))
+    if locale is not None:
+        _overrides.locale = locale
+    if timezone is not None:
+        _overrides.timezone = timezone
+    try:
+        yield
+    finally:
+        _overrides.locale, _overrides.timezone = previous
+
+
 def get_locale():
     """
     Build a ``babel.Locale`` based on locale factory
     :return: ``babel.Locale``
     """
-    return babel.Locale.parse(_get_locale())
+    name = getattr(_overrides, 'locale', None) or _get_locale()
+    if not isinstance(name, basestring):
+        return babel.Locale.parse(name)
+    locale = _locales.get(name)
+    if locale is None:
+        locale = _locales.setdefault(name, babel.Locale.parse(name))
+    return locale
 
 
 def get_timezone():
@@ -56,4 +89,4 @@ def get_timezone():
     Build a ``babel.Timezone`` based on tz factory
     :return: ``babel.Timezone``
     """
-    return dates.get_timezone(_get_tz())
+    return dates.get_timezone(getattr(_overrides, 'timezone', None) or _get_tz())
@@ -2,14 +2,19 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+import re
+import time
 import unittest
 from decimal import Decimal
 
+from google.appengine.api import memcache
 from google.appengine.ext.ndb import Model, Key
 
 from gaeforms import base, settings
 from gaeforms.base import BaseField, Form, IntegerField, DecimalField, StringField, DateField, DateTimeField, \
-    FloatField, EmailField, BooleanField, KeyField
+    FloatField, EmailField, BooleanField, KeyField, InputTooLarge
+from gaeforms.cache import LRUCache
+from gaeforms.pool import FormPool
 from util import GAETestCase
 
 @settings.locale_factory
@@ -66,9 +71,31 @@ class FormTests(unittest.TestCase):
         form = FormExample(attr1=False, attr2=False)
         self.assertDictEqual({'attr1': error_msg('attr1'), 'attr2': error_msg('attr2')}, form.validate())
 
-    def test_normalize(self):
-        form = FormExample(attr1='1', attr2='2')
-        self.assertDictEqual({'attr1': 1, 'attr2': 2}, form.normalize())
+    def test_validate_fail_fast(self):
+        class CostForm(Form):
+            integer = IntegerField()
+            string = StringField(required=True)
+
+        form = CostForm(integer='foo', string='')
+        self.assertDictEqual({'integer': 'Must be integer', 'string': 'Required field'}, form.validate())
+        self.assertDictEqual({'string': 'Required field'}, form.validate(fail_fast=True))
+        form.string = 'bar'
+        self.assertDictEqual({'integer': 'Must be integer'}, form.validate(fail_fast=True))
+        form.integer = '1'
+        self.assertDictEqual({}, form.validate(fail_fast=True))
+
+    def test_validate_many(self):
+        payloads = [{'attr1': True, 'attr2': True},
+                    {'attr1': False, 'attr2': False},
+                    {'attr1': True, 'attr2': True},
+                    {'attr1': True, 'attr2': False}]
+        self.assertDictEqual({1: {'attr1': error_msg('attr1'), 'attr2': error_msg('attr2')},
+                              3: {'attr2': error_msg('attr2')}},
+                             FormExample.validate_many(payloads))
+        errors = FormExample.validate_many(payloads, fail_fast=True)
+        self.assertListEqual([1], errors.keys())
+        self.assertEqual(1, len(errors[1]))
+        self.assertDictEqual({}, FormExample.validate_many(payloads[:1], fail_fast=True))
 
     def test_normalize(self):
         form = FormExample(attr1='1', attr2='2')
@@ -89,6 +116,34 @@ class FormTests(unittest.TestCase):
         self.assertDictEqual({'attr2': 'two'}, form.localize('attr2', attr1=1, attr2=2))
         self.assertDictEqual({'attr1': 'one', 'attr2': 'two'}, form.localize('attr1', 'attr2', attr1=1, attr2=2))
 
+    def test_dirty_fields(self):
+        form = FormExample(attr1='1')
+        self.assertSetEqual(set(['attr1']), form.dirty_fields)
+        form.localize(attr1=1, attr2=2)
+        self.assertSetEqual(set(['attr1']), form.dirty_fields)
+        form.attr2 = ''
+        self.assertSetEqual(set(['attr1', 'attr2']), form.dirty_fields)
+
+    def test_dirty_fields_without_form_init(self):
+        class NoSuperInitForm(FormExample):
+            attr1 = MockField()
+
+            def __init__(self, attr1):
+                self.attr1 = attr1
+
+        form = NoSuperInitForm('1')
+        self.assertSetEqual({'attr1'}, form.dirty_fields)
+        self.assertDictEqual({}, form.validate())
+        self.assertDictEqual({'attr1': 1}, form.normalize())
+
+    def test_only_dirty(self):
+        form = FormExample(attr2='2')
+        self.assertDictEqual({'attr1': error_msg('attr1')}, form.validate())
+        self.assertDictEqual({}, form.validate(only_dirty=True))
+        self.assertDictEqual({'attr2': 2}, form.normalize(only_dirty=True))
+        form.fill(attr1='')
+        self.assertDictEqual({'attr1': error_msg('attr1')}, form.validate(only_dirty=True))
+
     def test_fill(self):
         form = FormExample()
         self.assertFalse(hasattr(form, 'attr1'))
@@ -96,6 +151,405 @@ class FormTests(unittest.TestCase):
         form.fill(attr1='one', attr2='two')
         self.assertDictEqual({'attr1': 'one', 'attr2': 'two'}, {'attr1': form.attr1, 'attr2': form.attr2})
 
+    def test_normalize_memoization(self):
+        calls = []
+
+        class CountingField(IntegerField):
+            def normalize_field(self, value):
+                calls.append(value)
+                return super(CountingField, self).normalize_field(value)
+
+        class CountingForm(Form):
+            number = CountingField()
+
+        form = CountingForm(number='1')
+        self.assertDictEqual({'number': 1}, form.normalize())
+        self.assertDictEqual({'number': 1}, form.normalize())
+        self.assertListEqual(['1'], calls)
+        form.number = '2'
+        self.assertDictEqual({'number': 2}, form.normalize())
+        form.fill(number='3')
+        self.assertDictEqual({'number': 3}, form.normalize(only_dirty=True))
+        form.localize(number=4)
+        self.assertDictEqual({'number': 4}, form.normalize())
+        form.refill(number='5')
+        self.assertDictEqual({'number': 5}, form.normalize())
+        self.assertListEqual(['1', '2', '3', 4, '5'], calls)
+
+    def test_normalize_returns_copies(self):
+        class RepeatedForm(Form):
+            numbers = IntegerField(repeated=True)
+
+        form = RepeatedForm(numbers=['1', '2'])
+        form.normalize()['numbers'].append(3)
+        self.assertDictEqual({'numbers': [1, 2]}, form.normalize())
+        form._result_cache = LRUCache()
+        self.assertDictEqual({}, form.validate())
+        form.normalize()['numbers'].append(3)
+        cached = RepeatedForm(numbers=['1', '2'])
+        cached._result_cache = form._result_cache
+        self.assertDictEqual({}, cached.validate())
+        self.assertDictEqual({'numbers': [1, 2]}, cached.normalize())
+
+    def test_reset_and_refill(self):
+        form = FormExample(attr1='one', attr2='2')
+        form.validate()
+        form.reset()
+        self.assertFalse(hasattr(form, 'attr1'))
+        self.assertFalse(hasattr(form, 'attr2'))
+        self.assertSetEqual(set(), form.dirty_fields)
+        self.assertIs(form, form.refill(attr2='3'))
+        self.assertFalse(hasattr(form, 'attr1'))
+        self.assertEqual('3', form.attr2)
+        self.assertSetEqual({'attr2'}, form.dirty_fields)
+
+
+class MultiDictMock(dict):
+    def getall(self, key):
+        return self.get(key, [])
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, key)[-1]
+
+
+class RepeatedFormMock(Form):
+    ages = IntegerField(repeated=True)
+    name = StringField()
+
+
+class GuardedFormMock(Form):
+    _max_items = 3
+    _max_payload_chars = 20
+    ages = IntegerField(repeated=True)
+    name = StringField()
+
+
+class RangeFormMock(Form):
+    start = IntegerField(required=True)
+    end = IntegerField(required=True)
+    step = IntegerField()
+
+    @base.validator('start', 'end')
+    def validate_range(self, values):
+        if values['start'] > values['end']:
+            return {'end': 'Must be greater than start'}
+
+
+class StepRangeFormMock(RangeFormMock):
+    # Form fields are not inherited
+    start = IntegerField(required=True)
+    end = IntegerField(required=True)
+    step = IntegerField()
+
+    @base.validator('step')
+    def validate_step(self, values):
+        if values['step'] == 0:
+            return {'step': 'Must not be zero'}
+
+
+class ValidatorTests(unittest.TestCase):
+    def test_validator(self):
+        self.assertDictEqual({}, RangeFormMock(start='1', end='2').validate())
+        form = RangeFormMock(start='3', end='2')
+        self.assertDictEqual({'end': 'Must be greater than start'}, form.validate())
+        self.assertNotIn('end', form._valid_fields)
+        self.assertDictEqual({'end': 'Must be integer'}, RangeFormMock(start='3', end='a').validate())
+
+    def test_inheritance(self):
+        validators = [name for name, fields in StepRangeFormMock._validators]
+        self.assertListEqual(['validate_range', 'validate_step'], validators)
+        form = StepRangeFormMock(start='3', end='2', step='0')
+        self.assertDictEqual({'end': 'Must be greater than start', 'step': 'Must not be zero'}, form.validate())
+        self.assertEqual(1, len(form.validate(fail_fast=True)))
+
+    def test_unknown_field(self):
+        def create_form():
+            class TypoFormMock(Form):
+                password = StringField()
+
+                @base.validator('pasword')
+                def validate_password(self, values):
+                    pass
+
+        self.assertRaises(TypeError, create_form)
+
+    def test_only_dirty(self):
+        form = StepRangeFormMock()
+        form.fill(start='3', end='2', step='1')
+        form.reset()
+        form.step = '0'
+        self.assertDictEqual({'step': 'Must not be zero'}, form.validate(only_dirty=True))
+
+    def test_normalized_once(self):
+        form = RangeFormMock(start='1', end='2')
+        form.validate()
+        self.assertDictEqual({'start': 1, 'end': 2}, form._normalized)
+
+
+class CountingIntegerField(IntegerField):
+    calls = 0
+
+    def validate_field(self, value):
+        CountingIntegerField.calls += 1
+        return super(CountingIntegerField, self).validate_field(value)
+
+
+class CachedFormMock(Form):
+    _result_cache = LRUCache()
+    number = CountingIntegerField()
+    name = StringField(required=True)
+
+
+class CachedKeyFormMock(Form):
+    _result_cache = LRUCache()
+    number = CountingIntegerField()
+    key = KeyField()
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        CachedFormMock._result_cache.clear()
+        CountingIntegerField.calls = 0
+
+    def test_cache(self):
+        self.assertDictEqual({}, CachedFormMock(number='1', name='Joe').validate())
+        form = CachedFormMock(number='1', name='Joe')
+        self.assertDictEqual({}, form.validate())
+        self.assertEqual(1, CountingIntegerField.calls)
+        self.assertDictEqual({'number': 1, 'name': 'Joe'}, form._normalized)
+        self.assertSetEqual(set(), form._valid_fields)
+        self.assertDictEqual({'number': 1, 'name': 'Joe'}, form.normalize())
+
+    def test_errors(self):
+        self.assertDictEqual({'name': 'Required field'}, CachedFormMock(number='1').validate())
+        form = CachedFormMock(number='1')
+        self.assertDictEqual({'name': 'Required field'}, form.validate())
+        self.assertEqual(1, CountingIntegerField.calls)
+        self.assertSetEqual(set(), form._valid_fields)
+
+    def test_cached_errors_are_copies(self):
+        class CachedTagsFormMock(Form):
+            _result_cache = LRUCache()
+            name = StringField(required=True)
+            tags = IntegerField(repeated=True)
+
+        for i in xrange(3):
+            errors = CachedTagsFormMock(name='', tags=['1', 'a']).validate()
+            self.assertDictEqual({'name': 'Required field', 'tags': {1: 'Must be integer'}}, errors)
+            errors['extra'] = 'x'
+            errors['tags'][5] = 'x'
+
+    def test_key_depends_on_values_and_locale(self):
+        CachedFormMock(number='1', name='Joe').validate()
+        CachedFormMock(number='2', name='Joe').validate()
+        CachedFormMock(number='1', name='Joe').validate(fail_fast=True)
+        with settings.override('pt_BR'):
+            CachedFormMock(number='1', name='Joe').validate()
+        self.assertEqual(4, CountingIntegerField.calls)
+
+    def test_key_depends_on_configuration(self):
+        form = CachedFormMock(number='1', name='Joe')
+        key = form._result_cache_key(False)
+        field = CachedFormMock._fields['name']
+        max_len, schema = field.max_len, CachedFormMock.__dict__['_json_schema_cache']
+        try:
+            field.max_len = 2
+            del CachedFormMock._json_schema_cache
+            self.assertNotEqual(key, form._result_cache_key(False))
+        finally:
+            field.max_len, CachedFormMock._json_schema_cache = max_len, schema
+        validators = CachedFormMock._validators
+        try:
+            CachedFormMock._validators = (('validate_name', ('name',)),)
+            self.assertNotEqual(key, form._result_cache_key(False))
+        finally:
+            CachedFormMock._validators = validators
+        self.assertEqual(key, form._result_cache_key(False))
+
+    def test_backend_ttl(self):
+        form = CachedFormMock(number='1', name='Joe')
+        form._result_cache = LRUCache(ttl=60)
+        start = time.time()
+        form.validate()
+        expires, value = form._result_cache._data[form._result_cache_key(False)]
+        self.assertTrue(start + 60 <= expires <= time.time() + 60)
+
+    def test_not_deterministic(self):
+        CachedKeyFormMock(number='1').validate()
+        CachedKeyFormMock(number='1').validate()
+        self.assertEqual(2, CountingIntegerField.calls)
+        self.assertEqual(0, len(CachedKeyFormMock._result_cache))
+
+
+class MemcacheResultCacheTests(GAETestCase):
+    def test_memcache(self):
+        class MemcachedFormMock(Form):
+            _result_cache = memcache
+            number = CountingIntegerField()
+
+        CountingIntegerField.calls = 0
+        MemcachedFormMock(number='1').validate()
+        form = MemcachedFormMock(number='1')
+        self.assertDictEqual({}, form.validate())
+        self.assertEqual(1, CountingIntegerField.calls)
+        self.assertDictEqual({'number': 1}, form.normalize())
+
+
+class InputGuardsTests(unittest.TestCase):
+    def test_max_input_len(self):
+        field = IntegerField()
+        self.assertEqual('Has 33 characters and it must have 32 or less', field.validate('1' * 33))
+        self.assertEqual('Must be integer', field.validate('a' * 32))
+        field.max_input_len = None
+        self.assertIsNone(field.validate('1' * 33))
+        self.assertEqual('Has 65 characters and it must have 64 or less', DecimalField().validate('1' * 65))
+
+    def test_max_items(self):
+        field = IntegerField(repeated=True)
+        field.max_items = 2
+        self.assertEqual('Has 3 items and it must have 2 or less', field.validate(['a', 'b', 'c']))
+        self.assertDictEqual({1: 'Must be integer'}, field.validate(['1', 'b']))
+        self.assertEqual(2, field.schema()['maxItems'])
+
+    def test_form_guards(self):
+        form = GuardedFormMock(ages=['1', '2', '3', '4'])
+        self.assertDictEqual({'ages': 'Has 4 items and it must have 3 or less'}, form.validate())
+        form = GuardedFormMock(ages=['1'] * 2, name='a' * 19)
+        self.assertDictEqual({'_payload': 'Has 21 characters and it must have 20 or less'}, form.validate())
+        self.assertDictEqual({}, GuardedFormMock(ages=['1', '2'], name='Joe').validate())
+
+    def test_normalize_without_validate(self):
+        self.assertRaises(InputTooLarge, IntegerField().normalize, '1' * 33)
+        field = IntegerField(repeated=True)
+        field.max_items = 2
+        self.assertRaises(InputTooLarge, field.normalize, ['1', '2', '3'])
+        self.assertRaises(InputTooLarge, GuardedFormMock(ages=['1', '2', '3', '4']).normalize)
+        self.assertRaises(InputTooLarge, GuardedFormMock(ages=['1'] * 2, name='a' * 19).normalize)
+        self.assertDictEqual({'ages': [1, 2], 'name': 'Joe'}, GuardedFormMock(ages=['1', '2'], name='Joe').normalize())
+
+    def test_nested_payload_chars(self):
+        form = GuardedFormMock(name=[{'first': 'a' * 10}, ('b' * 10, {'c': 'd'})])
+        self.assertEqual(27, form._payload_chars())
+
+
+class FromMappingTests(unittest.TestCase):
+    def test_multidict(self):
+        params = MultiDictMock(ages=['1', '2'], name=['Joe', 'John'], attacker=['x'])
+        form = RepeatedFormMock.from_multidict(params)
+        self.assertListEqual(['1', '2'], form.ages)
+        self.assertEqual('John', form.name)
+        self.assertFalse(hasattr(form, 'attacker'))
+        self.assertDictEqual({'ages': [1, 2], 'name': 'John'}, form.normalize())
+
+    def test_missing_keys(self):
+        form = RepeatedFormMock.from_multidict(MultiDictMock())
+        self.assertSetEqual(set(), form.dirty_fields)
+
+    def test_mapping(self):
+        form = RepeatedFormMock.from_multidict({'ages': ['1'], 'other': 'x'})
+        self.assertListEqual(['1'], form.ages)
+        self.assertSetEqual({'ages'}, form.dirty_fields)
+
+
+class FormPoolTests(unittest.TestCase):
+    def test_reuse(self):
+        pool = FormPool(FormExample, maxsize=1)
+        with pool.form(attr1='one') as form:
+            self.assertEqual('one', form.attr1)
+        self.assertEqual(1, len(pool))
+        with pool.form(attr2='2') as reused:
+            self.assertIs(form, reused)
+            self.assertFalse(hasattr(reused, 'attr1'))
+            self.assertEqual('2', reused.attr2)
+            other = pool.acquire()
+            self.assertIsNot(form, other)
+        pool.release(other)
+        self.assertEqual(1, len(pool))
+
+
+class FieldOptionsTests(unittest.TestCase):
+    def test_equal_fields_share_options(self):
+        field, other = IntegerField(lower=0, choices=[1, 2]), IntegerField(lower=0, choices=[1, 2])
+        self.assertIs(field._options, other._options)
+        self.assertIsNot(field._options, IntegerField(lower=0, choices=[1, 3])._options)
+        self.assertIsNot(field._options, IntegerField(lower=0.0, choices=[1, 2])._options)
+        self.assertIsNot(field._options, CountingIntegerField(lower=0, choices=[1, 2])._options)
+        self.assertIsNot(DecimalField(lower='1.0')._options, DecimalField(lower='1.00', decimal_places=3)._options)
+        self.assertEqual((1, 2), field.choices)
+
+    def test_copy_on_write(self):
+        field, other = StringField(max_len=5), StringField(max_len=5)
+        other.max_len = 3
+        self.assertEqual(5, field.max_len)
+        self.assertEqual(3, other.max_len)
+        self.assertIs(field._options, StringField(max_len=5)._options)
+        self.assertRaises(AttributeError, setattr, field._options, 'max_len', 3)
+        other.max_input_len = 4
+        self.assertIsNone(field.max_input_len)
+
+    def test_compiled_values_shared(self):
+        pattern = DateField().get_date_format('pt_BR')
+        self.assertIs(pattern, DateField().get_date_format('pt_BR'))
+        self.assertIn(('date_format', 'pt_BR'), DateField()._options._compiled)
+        self.assertNotIn(('date_format', 'pt_BR'), DateField(format='medium')._options._compiled)
+
+    def test_unhashable_options(self):
+        field = IntegerField(default={1})
+        self.assertSetEqual({1}, field.default)
+        self.assertIsNot(field._options, IntegerField(default={1})._options)
+
+
+class JsonSchemaTests(unittest.TestCase):
+    def test_schema(self):
+        class SchemaForm(Form):
+            name = StringField(required=True, max_len=10)
+            code = StringField(exactly_len=3, choices=['abc', 'def'])
+            age = IntegerField(lower=0, upper=150, default=18)
+            price = DecimalField(lower=1)
+            tags = StringField(repeated=True, required=True)
+            email = EmailField(max_len=None)
+            birth = DateField()
+
+        self.assertDictEqual({'$schema': 'http://json-schema.org/draft-04/schema#',
+                              'title': 'SchemaForm',
+                              'type': 'object',
+                              'required': ['name', 'tags'],
+                              'properties': {
+                                  'name': {'type': 'string', 'maxLength': 10},
+                                  'code': {'type': 'string', 'minLength': 3, 'maxLength': 3,
+                                           'enum': ['abc', 'def']},
+                                  'age': {'type': 'integer', 'minimum': 0, 'maximum': 150, 'default': 18},
+                                  'price': {'type': 'number', 'minimum': 1.0},
+                                  'tags': {'type': 'array', 'minItems': 1,
+                                           'items': {'type': 'string', 'maxLength': base._MAX_STRING_LENGTH}},
+                                  'email': {'type': 'string', 'format': 'email'},
+                                  'birth': {'type': 'string', 'pattern': base._DATE_PATTERN}}},
+                             SchemaForm.json_schema())
+
+    def test_schema_accepts_localized_values(self):
+        date_pattern = re.compile(DateField().schema()['pattern'])
+        datetime_pattern = re.compile(DateTimeField().schema()['pattern'])
+        for locale in ('en_US', 'pt_BR', 'de_DE'):
+            with settings.override(locale=locale):
+                date = DateField().localize(datetime.date(2016, 12, 25))
+                dtime = DateTimeField().localize(datetime.datetime(2016, 12, 25, 18, 0, 0))
+            self.assertTrue(date_pattern.search(date), date)
+            self.assertTrue(datetime_pattern.search(dtime), dtime)
+        with settings.override(locale='hu_HU'):
+            self.assertTrue(date_pattern.search(DateField().localize(datetime.date(2016, 12, 25))))
+        self.assertFalse(datetime_pattern.search('12/25/2016'))
+
+    def test_cache(self):
+        class SchemaForm(Form):
+            name = StringField()
+
+        class AnotherSchemaForm(Form):
+            name = StringField(required=True)
+
+        self.assertIs(SchemaForm.json_schema(), SchemaForm.json_schema())
+        self.assertEqual(SchemaForm.json_schema_etag(), SchemaForm.json_schema_etag())
+        self.assertNotEqual(SchemaForm.json_schema_etag(), AnotherSchemaForm.json_schema_etag())
+
 
 class BaseFieldTests(unittest.TestCase):
     def test_required(self):
@@ -149,9 +603,25 @@ class BaseFieldTests(unittest.TestCase):
         self.assertIsNone(field.validate(['1']))
         self.assertIsNone(field.validate(['1', '2']))
         self.assertEqual('Required field', field.validate(None))
-        self.assertEqual('Required field', field.validate([None]))
+        self.assertDictEqual({0: 'Required field'}, field.validate([None]))
         self.assertEqual('Required field', field.validate([]))
-        self.assertEqual('Required field', field.validate(['1,', None]))
+        self.assertDictEqual({1: 'Required field'}, field.validate(['1,', None]))
+
+    def test_repeated_errors_by_index(self):
+        field = IntegerField(repeated=True, required=True)
+        field._set_attr_name('n')
+        values = ['foo', '1', None, 'bar']
+        self.assertDictEqual({0: 'Must be integer', 2: 'Required field', 3: 'Must be integer'},
+                             field.validate(values))
+        field.max_errors = 2
+        self.assertDictEqual({0: 'Must be integer', 2: 'Required field'}, field.validate(values))
+
+    def test_repeated_fail_fast(self):
+        field = IntegerField(repeated=True, required=True)
+        field._set_attr_name('n')
+        self.assertDictEqual({0: 'Required field'}, field.validate([None, 'foo'], fail_fast=True))
+        self.assertDictEqual({1: 'Must be integer'}, field.validate(['1', 'foo', None], fail_fast=True))
+        self.assertIsNone(field.validate(['1', '2'], fail_fast=True))
 
     def test_repeated_normalization(self):
         field = MockField(repeated=True)
@@ -404,6 +874,9 @@ class DecimalFieldTests(unittest.TestCase):
         self.assertEqual(Decimal('1000.34'), field.normalize('1,000.34'))
         self.assertEqual(Decimal('1111000.34'), field.normalize('1,111,000.34'))
         self.assertEqual(Decimal('1111000.34'), field.normalize('1,111,000.3399999'))
+        self.assertEqual(Decimal('1.34'), field.normalize(1.339999999))
+        self.assertEqual(Decimal('2'), field.normalize(2))
+        self.assertEqual('Must be a number', field.validate(float('nan')))
         field = DecimalField(decimal_places=3)
         self.assertEqual(Decimal('1.340'), field.normalize('1.339999999'))
 
@@ -492,6 +965,19 @@ class DateFieldTests(unittest.TestCase):
         self.assertEqual('Invalid date. Valid example: 12/25/2016', field.validate('09/30/a'))
 
 
+class SettingsOverrideTests(unittest.TestCase):
+    def test_override(self):
+        field = DecimalField()
+        with settings.override('pt_BR'):
+            self.assertEqual('1.234,5', field.localize(Decimal('1234.5')))
+            with settings.override(timezone='UTC'):
+                self.assertEqual('pt_BR', str(settings.get_locale()))
+                self.assertEqual('UTC', settings.get_timezone().zone)
+            self.assertEqual('America/Sao_Paulo', settings.get_timezone().zone)
+        self.assertEqual('1,234.5', field.localize(Decimal('1234.5')))
+        self.assertIs(settings.get_locale(), settings.get_locale())
+
+
 class DateTimeFieldTests(unittest.TestCase):
     def test_normalization(self):
         field = DateTimeField()
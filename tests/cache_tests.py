@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import unittest
+
+from gaeforms import cache as cache_module
+from gaeforms.cache import LRUCache
+
+
+class ClockMock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_get_set(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.get('a', 1))
+        cache.set('a', 2)
+        self.assertEqual(2, cache.get('a'))
+        self.assertIn('a', cache)
+        cache.delete('a')
+        self.assertNotIn('a', cache)
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+    def test_ttl(self):
+        clock = ClockMock()
+        original_time, cache_module._time = cache_module._time, clock
+        try:
+            cache = LRUCache(ttl=10)
+            cache.set('a', 1)
+            cache.set('b', 2, time=20)
+            clock.now += 15
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(2, cache.get('b'))
+            clock.now += 10
+            self.assertIsNone(cache.get('b'))
+        finally:
+            cache_module._time = original_time
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import datetime
+import math
+import unittest
+from decimal import Decimal
+
+from gaeforms import columnar
+from gaeforms.base import Form, IntegerField, FloatField, DecimalField, DateField, StringField, InputTooLarge
+
+
+def as_list(column):
+    return column.tolist() if hasattr(column, 'tolist') else list(column)
+
+
+class ColumnsFormMock(Form):
+    integer = IntegerField(lower=0)
+    number = FloatField()
+    price = DecimalField(required=True)
+    birth = DateField()
+    name = StringField()
+    tags = StringField(repeated=True)
+
+
+class GuardedColumnsFormMock(Form):
+    _max_items = 2
+    _max_payload_chars = 10
+    _max_batch_size = 3
+    integer = IntegerField()
+    tags = StringField(repeated=True)
+
+
+class NormalizeManyTests(unittest.TestCase):
+    def test_columns(self):
+        payloads = [{'integer': '1,000', 'number': '1.5', 'price': '2.345', 'birth': '12/25/2016', 'name': 'Joe',
+                     'tags': ['a', 'b']},
+                    {'integer': '', 'price': '3', 'name': 'John'}]
+        batch = ColumnsFormMock.normalize_many(payloads)
+        self.assertEqual(2, len(batch))
+        self.assertDictEqual({}, batch.errors)
+        self.assertListEqual([True, True], as_list(batch.valid))
+        self.assertEqual(1000, batch.columns['integer'][0])
+        self.assertListEqual([False, True], as_list(batch.nulls['integer']))
+        self.assertEqual(1.5, batch.columns['number'][0])
+        self.assertListEqual([False, True], as_list(batch.nulls['number']))
+        self.assertListEqual([235, 300], as_list(batch.columns['price']))
+        self.assertListEqual([datetime.date(2016, 12, 25), None], as_list(batch.columns['birth']))
+        self.assertListEqual(['Joe', 'John'], as_list(batch.columns['name']))
+        self.assertListEqual([['a', 'b'], []], as_list(batch.columns['tags']))
+
+    def test_errors(self):
+        payloads = [{'integer': '-1', 'price': '1'},
+                    {'integer': 'a', 'price': ''},
+                    {'integer': '2', 'price': '1'}]
+        batch = ColumnsFormMock.normalize_many(payloads)
+        self.assertDictEqual({0: {'integer': 'Must be greater than 0'},
+                              1: {'integer': 'Must be integer', 'price': 'Required field'}}, batch.errors)
+        self.assertListEqual([False, False, True], as_list(batch.valid))
+        self.assertListEqual([True, True, False], as_list(batch.nulls['integer']))
+
+    def test_form_limits(self):
+        payloads = [{'integer': '1', 'tags': ['a', 'b', 'c']},
+                    {'integer': '2', 'tags': ['a' * 10]},
+                    {'integer': '3', 'tags': ['a']}]
+        batch = GuardedColumnsFormMock.normalize_many(payloads)
+        self.assertDictEqual({0: {'tags': 'Has 3 items and it must have 2 or less'},
+                              1: {'_payload': 'Has 11 characters and it must have 10 or less'}}, batch.errors)
+        self.assertListEqual([False, False, True], as_list(batch.valid))
+        self.assertListEqual([True, True, False], as_list(batch.nulls['integer']))
+        self.assertEqual(3, batch.columns['integer'][2])
+        for i, payload in enumerate(payloads):
+            self.assertDictEqual(GuardedColumnsFormMock(**payload).validate(), batch.errors.get(i, {}))
+
+    def test_batch_size(self):
+        payloads = [{'integer': '1'}] * 4
+        self.assertRaises(InputTooLarge, GuardedColumnsFormMock.normalize_many, payloads)
+        self.assertRaises(InputTooLarge, GuardedColumnsFormMock.validate_many, payloads)
+        self.assertEqual(3, len(GuardedColumnsFormMock.normalize_many(payloads[:3])))
+
+    def test_same_as_form(self):
+        values = ['1', '1,234', '1.234', '-5', ' 7 ', '1e3', '', None, 'x', 10, '12345678901234567890123']
+        payloads = [{'integer': v, 'number': v, 'price': v} for v in values]
+        batch = ColumnsFormMock.normalize_many(payloads)
+        for i, payload in enumerate(payloads):
+            form = ColumnsFormMock(**payload)
+            errors = form.validate()
+            self.assertDictEqual(errors, batch.errors.get(i, {}))
+            for k in ('integer', 'number', 'price'):
+                if k not in errors:
+                    field = ColumnsFormMock._fields[k]
+                    expected = field._column_value(field.normalize(payload[k]))
+                    if expected is None:
+                        self.assertTrue(batch.nulls[k][i])
+                    else:
+                        self.assertEqual(expected, batch.columns[k][i])
+
+    def test_choices_and_bounds(self):
+        class ChoicesFormMock(Form):
+            level = IntegerField(choices=[1, 2, 3])
+            rate = DecimalField(choices=[Decimal('1.5'), Decimal('2')], upper=Decimal('1.8'))
+
+        payloads = [{'level': '2', 'rate': '1.5'},
+                    {'level': '4', 'rate': '2'},
+                    {'level': '', 'rate': '1.7'}]
+        batch = ChoicesFormMock.normalize_many(payloads)
+        for i, payload in enumerate(payloads):
+            self.assertDictEqual(ChoicesFormMock(**payload).validate(), batch.errors.get(i, {}))
+        self.assertListEqual([True, False, False], as_list(batch.valid))
+        self.assertListEqual([False, True, True], as_list(batch.nulls['level']))
+        self.assertEqual(150, batch.columns['rate'][0])
+
+    def test_string_choices(self):
+        class StringChoicesFormMock(Form):
+            level = IntegerField(choices=['1', '2'])
+            rate = DecimalField(choices=['1.50', '2.00'])
+
+        payloads = [{'level': '1', 'rate': '1.50'},
+                    {'level': 1, 'rate': Decimal('2')},
+                    {'level': '', 'rate': ''}]
+        batch = StringChoicesFormMock.normalize_many(payloads)
+        for i, payload in enumerate(payloads):
+            self.assertDictEqual(StringChoicesFormMock(**payload).validate(), batch.errors.get(i, {}))
+        self.assertDictEqual({'level': 'Must be one of: 1; 2', 'rate': 'Must be one of: 1.50; 2.00'}, batch.errors[0])
+
+    def test_dates(self):
+        values = ['12/25/2016', ' 1/2/16 ', '25/12/2016', '2/30/2016', '12-25-2016', 'x', '', None,
+                  datetime.date(2016, 1, 1)]
+        payloads = [{'birth': v, 'price': '1'} for v in values]
+        batch = ColumnsFormMock.normalize_many(payloads)
+        for i, payload in enumerate(payloads):
+            self.assertDictEqual(ColumnsFormMock(**payload).validate(), batch.errors.get(i, {}))
+        self.assertListEqual([datetime.date(2016, 12, 25), datetime.date(2016, 1, 2), datetime.date(2016, 12, 25),
+                              None, datetime.date(2016, 12, 25), None, None, None, datetime.date(2016, 1, 1)],
+                             as_list(batch.columns['birth']))
+        self.assertDictEqual({'birth': 'Invalid date. Valid example: 12/25/2016'}, batch.errors[3])
+
+
+class BuildColumnTests(unittest.TestCase):
+    @unittest.skipIf(columnar.numpy is None, 'numpy is not installed')
+    def test_dtypes(self):
+        self.assertEqual('int64', columnar.build_column([1, None], 'int64').dtype.name)
+        self.assertListEqual([1, 0], columnar.build_column([1, None], 'int64').tolist())
+        self.assertTrue(math.isnan(columnar.build_column([1.0, None], 'float64')[1]))
+        self.assertEqual('object', columnar.build_column([10 ** 30, None], 'int64').dtype.name)
+        self.assertEqual('datetime64[D]', columnar.build_column([datetime.date(2016, 1, 1), None],
+                                                                'datetime64[D]').dtype.name)
+
+    def test_to_dates(self):
+        self.assertListEqual([datetime.date(2016, 12, 25), datetime.date(2016, 12, 25), None, None],
+                             columnar.to_dates(['16', '2016', '2016', '0'], ['12', '25', '2', '1'],
+                                               ['25', '12', '30', '1']))
+
+    @unittest.skipIf(columnar.numpy is not None, 'numpy is installed')
+    def test_lists(self):
+        self.assertListEqual([1, None], columnar.build_column([1, None], 'int64'))
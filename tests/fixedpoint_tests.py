@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+from decimal import Decimal
+import unittest
+
+from babel import Locale
+from babel.numbers import format_decimal
+
+from gaeforms.fixedpoint import parse_scaled, decimal_to_scaled, scaled_to_decimal, format_fixed
+
+EN_US = Locale.parse('en_US')
+PT_BR = Locale.parse('pt_BR')
+
+
+class ParseScaledTests(unittest.TestCase):
+    def test_plain_numbers(self):
+        self.assertEqual(100, parse_scaled('1', 2, EN_US))
+        self.assertEqual(123456, parse_scaled('1,234.56', 2, EN_US))
+        self.assertEqual(-150, parse_scaled('-1.5', 2, EN_US))
+        self.assertEqual(50, parse_scaled('.5', 2, EN_US))
+
+    def test_locale(self):
+        self.assertEqual(123456, parse_scaled('1.234,56', 2, PT_BR))
+        self.assertEqual(150, parse_scaled('1,5', 2, PT_BR))
+
+    def test_exact_rounding(self):
+        self.assertEqual(101, parse_scaled('1.005', 2, EN_US))
+        self.assertEqual(133, parse_scaled('1.3349999999999999999999999', 2, EN_US))
+        self.assertEqual(-101, parse_scaled('-1.005', 2, EN_US))
+
+    def test_babel_fallback(self):
+        self.assertEqual(120000, parse_scaled('1.2E3', 2, EN_US))
+        self.assertRaises(Exception, parse_scaled, 'a', 2, EN_US)
+
+
+class DecimalConversionTests(unittest.TestCase):
+    def test_decimal_to_scaled(self):
+        self.assertEqual(123, decimal_to_scaled(Decimal('1.23'), 2))
+        self.assertEqual(124, decimal_to_scaled(Decimal('1.235'), 2))
+        self.assertEqual(1000, decimal_to_scaled(Decimal('1E1'), 2))
+        self.assertEqual(-1, decimal_to_scaled(Decimal('-0.005'), 2))
+        self.assertRaises(ValueError, decimal_to_scaled, Decimal('NaN'), 2)
+
+    def test_exponent_bounds(self):
+        self.assertRaises(ValueError, decimal_to_scaled, Decimal('1E99999999'), 2)
+        self.assertRaises(ValueError, parse_scaled, '1E99999999', 2, EN_US)
+        self.assertEqual(0, decimal_to_scaled(Decimal('1E-99999999'), 2))
+        self.assertEqual(0, decimal_to_scaled(Decimal('-0E99999999'), 2))
+        self.assertEqual(0, decimal_to_scaled(Decimal('4.9E-3'), 2))
+        self.assertEqual(1, decimal_to_scaled(Decimal('5E-3'), 2))
+        self.assertEqual(10 ** 40, decimal_to_scaled(Decimal('1E38'), 2))
+
+    def test_scaled_to_decimal(self):
+        for scaled in (0, 1, 10, 100, 123, -5, 120000, -1000):
+            for places in (0, 1, 2, 3):
+                expected = Decimal(scaled) / 10 ** places
+                result = scaled_to_decimal(scaled, places)
+                self.assertEqual(expected, result)
+                self.assertEqual(unicode(expected), unicode(result))
+
+
+class FormatFixedTests(unittest.TestCase):
+    def test_same_as_babel(self):
+        for locale in (EN_US, PT_BR):
+            for value in ('0', '1', '1.5', '1234567.89', '-1234.5', '0.001', '1.0005'):
+                value = Decimal(value)
+                self.assertEqual(format_decimal(value, locale=locale), format_fixed(value, locale))
+
+    def test_not_decimal(self):
+        self.assertEqual('1,234.5', format_fixed(1234.5, EN_US))
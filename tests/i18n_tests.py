@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import os
+import unittest
+
+import babel
+
+import gaeforms
+from gaeforms import settings, i18n
+from babel.messages.pofile import read_po
+from gaeforms.base import IntegerField, BooleanField, StringField
+
+
+class GettextTests(unittest.TestCase):
+    def test_translation(self):
+        field = IntegerField(required=True)
+        with settings.override('pt_BR'):
+            self.assertEqual('Campo obrigatório', field.validate(None))
+            self.assertEqual('Deve ser inteiro', field.validate('a'))
+        with settings.override('en_US'):
+            self.assertEqual('Required field', field.validate(None))
+            self.assertEqual('Not translated', i18n.gettext('Not translated'))
+
+    def test_catalog_cache(self):
+        locale = babel.Locale.parse('pt_BR')
+        catalog = i18n.get_catalog(locale)
+        self.assertEqual('Campo obrigatório', catalog['Required field'])
+        self.assertIs(catalog, i18n.get_catalog(babel.Locale.parse('pt_BR')))
+        self.assertDictEqual({}, i18n.get_catalog(babel.Locale.parse('pt_PT')))
+
+    def test_catalogs_inside_package(self):
+        package_dir = os.path.dirname(os.path.abspath(gaeforms.__file__))
+        self.assertEqual(os.path.join(package_dir, 'locale'), i18n.locale_dir)
+        self.assertTrue(os.path.exists(os.path.join(i18n.locale_dir, 'pt_BR', 'LC_MESSAGES', 'messages.mo')))
+
+    def test_all_messages_translated(self):
+        with open(os.path.join(i18n.locale_dir, 'messages.pot'), 'rb') as pot_file:
+            messages = {message.id for message in read_po(pot_file) if message.id}
+        catalog = i18n.get_catalog(babel.Locale.parse('pt_BR'))
+        self.assertSetEqual(set(), messages - set(catalog))
+        self.assertIn('Invalid value', messages)
+        field = StringField(repeated=True)
+        field.max_items = 1
+        with settings.override('pt_BR'):
+            self.assertEqual('Possui 2 itens e deve ter 1 ou menos', field.validate(['a', 'b']))
+            self.assertEqual('Deve ser verdadeiro ou falso', BooleanField().validate('x'))
@@ -1,21 +1,32 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 from decimal import Decimal
+import gc
+import time
 import unittest
+import weakref
 import datetime
 
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 from google.appengine.ext.ndb.polymodel import PolyModel
-from gaeforms import base
+from gaeforms import base, settings
+from gaeforms.cache import LRUCache
 
-from gaeforms.ndb.form import ModelForm, InvalidParams, ModelFormSecurityError
-from gaeforms.ndb.property import IntegerBounded, SimpleCurrency, SimpleDecimal, FloatBounded, Email
+from gaeforms.ndb.form import ModelForm, InvalidParams, ModelFormSecurityError, timing_report, field_class_for, \
+    registry, NotRegisteredProperty, modelform_for, modelform_cache, StructuredField, invalidate_localized, \
+    LocalizedCacheInvalidation
+from gaeforms.ndb.property import IntegerBounded, SimpleCurrency, SimpleDecimal, FloatBounded, Email, BoundaryError
 from util import GAETestCase
-from gaeforms.base import IntegerField
+from gaeforms.base import IntegerField, StringField, InputTooLarge, validator
 
 
 
 
+class SubIntegerBounded(IntegerBounded):
+    pass
+
+
 class IntegerModelMock(ndb.Model):
     integer = ndb.IntegerProperty()
     integer_required = ndb.IntegerProperty(required=True)
@@ -171,6 +182,16 @@ class ModelFormTests(GAETestCase):
         self.assertDictEqual(property_dct, model.to_dict())
         self.assertEqual(model_key, model.key)
 
+    def test_fill_model_only_dirty(self):
+        model = ModelMock(integer=1, float_bounded=2.2, str='a', i=3)
+        form = ModelFormMock(str='b')
+        self.assertDictEqual({}, form.validate(only_dirty=True))
+        form.fill_model(model, only_dirty=True)
+        self.assertEqual('b', model.str)
+        self.assertEqual(1, model.integer)
+        self.assertEqual(3, model.i)
+        self.assertEqual(2.2, model.float_bounded)
+
     def test_fill_model_attack(self):
         class EditableModel(ndb.Model):
             name = ndb.StringProperty()
@@ -274,6 +295,445 @@ class ModelFormTests(GAETestCase):
         self.assertEqual('', form.decimal)
 
 
+class CustomStringProperty(ndb.StringProperty):
+    pass
+
+
+class RegistryTests(unittest.TestCase):
+    def test_subclass_resolution(self):
+        class SubclassModel(ndb.Model):
+            custom = CustomStringProperty()
+            bounded = SubIntegerBounded(lower=1)
+
+        class SubclassForm(ModelForm):
+            _model_class = SubclassModel
+
+        self.assertIsInstance(SubclassForm._fields['custom'], StringField)
+        self.assertIsInstance(SubclassForm._fields['bounded'], IntegerField)
+        self.assertEqual(1, SubclassForm._fields['bounded'].lower)
+        self.assertIs(StringField, field_class_for(CustomStringProperty))
+
+    def test_registry_changes(self):
+        class SpecificStringProperty(ndb.StringProperty):
+            pass
+
+        class SpecificField(StringField):
+            pass
+
+        self.assertIs(StringField, field_class_for(SpecificStringProperty))
+        registry(SpecificStringProperty, SpecificField)
+        self.assertIs(SpecificField, field_class_for(SpecificStringProperty))
+
+    def test_not_registered(self):
+        def f():
+            class TimeModel(ndb.Model):
+                time = ndb.TimeProperty()
+
+            class TimeForm(ModelForm):
+                _model_class = TimeModel
+
+        self.assertRaises(NotRegisteredProperty, f)
+
+
+class ModelFormForTests(unittest.TestCase):
+    def test_cache(self):
+        form_class = modelform_for(IntegerModelMock)
+        self.assertTrue(issubclass(form_class, ModelForm))
+        self.assertEqual('IntegerModelMockForm', form_class.__name__)
+        self.assertSetEqual(set(IntegerModelForm._fields.iterkeys()), set(form_class._fields.iterkeys()))
+        self.assertIs(form_class, modelform_for(IntegerModelMock))
+
+    def test_include_exclude(self):
+        include = modelform_for(IntegerModelMock, include=[IntegerModelMock.integer, 'integer_required'])
+        self.assertSetEqual(set(['integer', 'integer_required']), set(include._fields.iterkeys()))
+        self.assertIs(include, modelform_for(IntegerModelMock, include=['integer_required', 'integer']))
+        exclude = modelform_for(IntegerModelMock, exclude=['integer'])
+        self.assertNotIn('integer', exclude._fields)
+        self.assertIsNot(include, exclude)
+
+    def test_eviction(self):
+        maxsize = modelform_cache.maxsize
+        modelform_cache.maxsize = 1
+        try:
+            form_class = modelform_for(IntegerModelMock)
+            modelform_for(IntegerModelMock, exclude=['integer'])
+            self.assertIsNot(form_class, modelform_for(IntegerModelMock))
+        finally:
+            modelform_cache.maxsize = maxsize
+
+
+class CountingProperty(ndb.IntegerProperty):
+    validations = 0
+
+    def _validate(self, value):
+        CountingProperty.validations += 1
+
+
+registry(CountingProperty, IntegerField, trusted=True)
+
+
+class CountingModel(ndb.Model):
+    counting = CountingProperty()
+    counting_repeated = CountingProperty(repeated=True)
+    name = ndb.StringProperty()
+
+
+class CountingForm(ModelForm):
+    _model_class = CountingModel
+
+
+class TrustedPopulateTests(unittest.TestCase):
+    def setUp(self):
+        CountingProperty.validations = 0
+
+    def test_not_validated(self):
+        form = CountingForm(counting='1', counting_repeated=['2', '3'], name='foo')
+        model = form.fill_model()
+        self.assertEqual(3, CountingProperty.validations)
+        self.assertDictEqual({'counting': 1, 'counting_repeated': [2, 3], 'name': 'foo'}, model.to_dict())
+
+    def test_validated(self):
+        form = CountingForm(counting='1', counting_repeated=['2', '3'], name='foo')
+        self.assertDictEqual({}, form.validate())
+        model = form.fill_model()
+        self.assertEqual(0, CountingProperty.validations)
+        self.assertDictEqual({'counting': 1, 'counting_repeated': [2, 3], 'name': 'foo'}, model.to_dict())
+        form.fill_model(model)
+        self.assertEqual(0, CountingProperty.validations)
+
+    def test_changed_after_validation(self):
+        form = CountingForm(counting='1', counting_repeated=[], name='foo')
+        form.validate()
+        form.counting = '2'
+        model = form.fill_model()
+        self.assertEqual(1, CountingProperty.validations)
+        self.assertEqual(2, model.counting)
+
+    def test_only_dirty(self):
+        form = CountingForm(counting='1')
+        form.validate(only_dirty=True)
+        model = CountingModel(name='foo')
+        form.fill_model(model, only_dirty=True)
+        self.assertEqual(0, CountingProperty.validations)
+        self.assertDictEqual({'counting': 1, 'counting_repeated': [], 'name': 'foo'}, model.to_dict())
+        form.counting_repeated = []
+        form.fill_model(model)
+        self.assertEqual(1, CountingProperty.validations)
+
+    def test_cached_result_is_not_trusted(self):
+        class CachedCountingForm(ModelForm):
+            _model_class = CountingModel
+            _result_cache = LRUCache()
+
+        CachedCountingForm(counting='1', counting_repeated=['2'], name='foo').validate()
+        form = CachedCountingForm(counting='1', counting_repeated=['2'], name='foo')
+        self.assertDictEqual({}, form.validate())
+        model = form.fill_model()
+        self.assertEqual(2, CountingProperty.validations)
+        self.assertDictEqual({'counting': 1, 'counting_repeated': [2], 'name': 'foo'}, model.to_dict())
+
+    def test_bounds_and_types_still_checked(self):
+        class CheckedModel(ndb.Model):
+            number = FloatBounded(lower=0, upper=10)
+            day = ndb.DateProperty()
+
+        class CheckedForm(ModelForm):
+            _model_class = CheckedModel
+
+        self.assertSetEqual({'day'}, CheckedForm._trusted_fields)
+        form = CheckedForm(number='100')
+        self.assertDictEqual({}, form.validate())
+        self.assertRaises(BoundaryError, form.fill_model)
+        self.assertRaises(BoundaryError, CheckedForm(number='-1').fill_model)
+        form = CheckedForm(day=5)
+        self.assertIn('day', form.validate())
+        self.assertRaises(ValueError, form.fill_model)
+        form = CheckedForm(number='10', day=datetime.date(2016, 12, 25))
+        self.assertDictEqual({}, form.validate())
+        self.assertEqual(CheckedModel(number=10.0, day=datetime.date(2016, 12, 25)), form.fill_model())
+
+    def test_only_built_fields_are_trusted(self):
+        self.assertSetEqual({'counting', 'counting_repeated'}, CountingForm._trusted_fields)
+        self.assertNotIn('integer', ModelFormOverriding._trusted_fields)
+        self.assertNotIn('email', ModelFormMock._trusted_fields)
+        form = ModelFormOverriding(integer='0', float_bounded='2.2')
+        self.assertDictEqual({}, form.validate())
+        self.assertRaises(BoundaryError, form.fill_model)
+
+
+class FieldSharingTests(unittest.TestCase):
+    def test_fields_are_not_shared(self):
+        class OtherIntegerModel(ndb.Model):
+            integer = ndb.IntegerProperty()
+
+        class OtherIntegerForm(ModelForm):
+            _model_class = OtherIntegerModel
+
+        field = OtherIntegerForm._fields['integer']
+        self.assertIsNot(IntegerModelForm._fields['integer'], field)
+        field.max_input_len = 4
+        self.assertEqual(32, IntegerModelForm._fields['integer'].max_input_len)
+
+    def test_options_are_shared(self):
+        class OtherIntegerModel(ndb.Model):
+            integer = ndb.IntegerProperty()
+            integer_required = ndb.IntegerProperty(required=True)
+
+        class OtherIntegerForm(ModelForm):
+            _model_class = OtherIntegerModel
+
+        for name in ('integer', 'integer_required'):
+            self.assertIs(IntegerModelForm._fields[name]._options, OtherIntegerForm._fields[name]._options)
+        self.assertIsNot(OtherIntegerForm._fields['integer']._options,
+                         OtherIntegerForm._fields['integer_required']._options)
+        OtherIntegerForm._fields['integer'].lower = 1
+        self.assertIsNone(IntegerModelForm._fields['integer'].lower)
+
+
+class ContactMock(ndb.Model):
+    name = ndb.StringProperty(required=True)
+    age = ndb.IntegerProperty()
+
+
+class AddressBookMock(ndb.Model):
+    owner = ndb.StructuredProperty(ContactMock)
+    contacts = ndb.LocalStructuredProperty(ContactMock, repeated=True)
+
+
+class AddressBookForm(ModelForm):
+    _model_class = AddressBookMock
+
+
+class StructuredFieldTests(unittest.TestCase):
+    def test_fields(self):
+        for name in ('owner', 'contacts'):
+            field = AddressBookForm._fields[name]
+            self.assertIsInstance(field, StructuredField)
+            self.assertIs(ContactMock, field.model_class)
+        self.assertTrue(AddressBookForm._fields['contacts'].repeated)
+
+    def test_validate(self):
+        form = AddressBookForm(owner={'name': 'Joe', 'age': '1'},
+                               contacts=[{'name': 'Ann'}, {'age': 'a'}, {'name': 'Bob'}])
+        errors = form.validate()
+        self.assertSetEqual({'contacts'}, set(errors))
+        self.assertSetEqual({1}, set(errors['contacts']))
+        self.assertSetEqual({'name', 'age'}, set(errors['contacts'][1]))
+        self.assertDictEqual({}, AddressBookForm(owner={'name': 'Joe'}).validate())
+        self.assertIn('owner', AddressBookForm(owner='Joe').validate())
+
+    def test_normalize_and_fill_model(self):
+        contacts = [{'name': 'Contact %s' % i, 'age': str(i)} for i in xrange(200)]
+        form = AddressBookForm(owner={'name': 'Joe'}, contacts=contacts)
+        self.assertDictEqual({}, form.validate())
+        book = form.fill_model()
+        self.assertEqual(ContactMock(name='Joe'), book.owner)
+        self.assertEqual(200, len(book.contacts))
+        self.assertEqual(ContactMock(name='Contact 199', age=199), book.contacts[-1])
+        self.assertEqual(1, len(modelform_for(ContactMock).__dict__['_form_pool']))
+
+    def test_nested_payload_guard(self):
+        class GuardedBookForm(AddressBookForm):
+            _model_class = AddressBookMock
+            _max_payload_chars = 20
+
+        form = GuardedBookForm(contacts=[{'name': 'a' * 10}, {'name': 'b' * 10, 'age': '1'}])
+        self.assertIn('_payload', form.validate())
+        self.assertRaises(InputTooLarge, form.fill_model)
+
+    def test_pool_lives_with_form_class(self):
+        class PooledContactMock(ndb.Model):
+            name = ndb.StringProperty()
+
+        maxsize = modelform_cache.maxsize
+        modelform_cache.maxsize = 1
+        try:
+            form_class = weakref.ref(modelform_for(PooledContactMock))
+            self.assertIsNone(StructuredField(PooledContactMock).validate({'name': 'Joe'}))
+            modelform_for(ContactMock)
+            gc.collect()
+            self.assertIsNone(form_class())
+        finally:
+            modelform_cache.maxsize = maxsize
+
+    def test_localize(self):
+        book = AddressBookMock(owner=ContactMock(name='Joe', age=1000),
+                               contacts=[ContactMock(name='Ann')])
+        localized = AddressBookForm().fill_with_model(book)
+        self.assertDictEqual({'name': 'Joe', 'age': 1000}, localized['owner'])
+        self.assertDictEqual({'name': 'Ann', 'age': ''}, localized['contacts'][0])
+
+    def test_schema(self):
+        schema = AddressBookForm.json_schema()['properties']
+        self.assertEqual('object', schema['owner']['type'])
+        self.assertEqual(['name'], schema['owner']['required'])
+        self.assertEqual('array', schema['contacts']['type'])
+
+
+class PriceMock(ndb.Model):
+    price = SimpleDecimal()
+    created = ndb.DateTimeProperty()
+
+
+class PriceForm(ModelForm):
+    _model_class = PriceMock
+
+
+class LocalizeForLocalesTests(GAETestCase):
+    def test_one_model(self):
+        model = PriceMock(price=Decimal('1234.5'), created=datetime.datetime(2016, 12, 25, 18, 0, 0))
+        model.put()
+        localized = PriceForm.localize_for_locales(model, ['en_US', 'pt_BR'], ['UTC', 'America/Sao_Paulo'])
+        self.assertEqual(2, len(localized))
+        en_us, pt_br = localized
+        self.assertEqual('1,234.5', en_us['price'])
+        self.assertEqual('12/25/2016 18:00:00', en_us['created'])
+        self.assertEqual('1.234,5', pt_br['price'])
+        self.assertEqual('25/12/2016 16:00:00', pt_br['created'])
+        self.assertEqual(model.key.id(), pt_br['id'])
+
+    def test_batch(self):
+        models = [PriceMock(price=Decimal(i)) for i in xrange(3)]
+        localized = PriceForm.localize_for_locales(models, ['en_US', 'pt_BR'], fields=['price'])
+        self.assertListEqual([[{'price': '0'}, {'price': '0'}],
+                              [{'price': '1'}, {'price': '1'}],
+                              [{'price': '2'}, {'price': '2'}]], localized)
+        self.assertRaises(InvalidParams, PriceForm.localize_for_locales, models, ['en_US'], ['UTC', 'UTC'])
+
+
+class CachedPriceForm(ModelForm):
+    _model_class = PriceMock
+    _localized_cache = LRUCache(ttl=60)
+
+
+class OtherCachedPriceForm(ModelForm):
+    _model_class = PriceMock
+    _include = ['price']
+    _localized_cache = CachedPriceForm._localized_cache
+
+
+class InvalidatingPriceMock(LocalizedCacheInvalidation, ndb.Model):
+    price = SimpleDecimal()
+
+
+class InvalidatingPriceForm(ModelForm):
+    _model_class = InvalidatingPriceMock
+    _localized_cache = LRUCache()
+
+
+class MemcachedPriceForm(ModelForm):
+    _model_class = PriceMock
+    _localized_cache = memcache
+    _version_property = 'created'
+
+
+class TagsMock(ndb.Model):
+    tags = ndb.StringProperty(repeated=True)
+
+
+class RequiredPriceMock(ndb.Model):
+    price = SimpleDecimal(required=True)
+
+
+class CachedTagsForm(ModelForm):
+    _model_class = TagsMock
+    _localized_cache = CachedPriceForm._localized_cache
+
+
+class LocalizedCacheTests(GAETestCase):
+    def setUp(self):
+        super(LocalizedCacheTests, self).setUp()
+        CachedPriceForm._localized_cache.clear()
+        InvalidatingPriceForm._localized_cache.clear()
+
+    def test_cache(self):
+        model = PriceMock(price=Decimal('1.5'))
+        model.put()
+        localized = CachedPriceForm().fill_with_model(model)
+        model.price = Decimal('2')
+        form = CachedPriceForm()
+        self.assertDictEqual(localized, form.fill_with_model(model))
+        self.assertEqual('1.5', form.price)
+        with settings.override('pt_BR'):
+            self.assertEqual('2', CachedPriceForm().fill_with_model(model)['price'])
+        self.assertEqual('2', CachedPriceForm().fill_with_model(model, 'price')['price'])
+
+    def test_invalidation(self):
+        model = PriceMock(price=Decimal('1.5'))
+        model.put()
+        CachedPriceForm().fill_with_model(model)
+        OtherCachedPriceForm().fill_with_model(model)
+        CachedPriceForm(price='3').fill_model(model)
+        self.assertEqual('1.5', CachedPriceForm().fill_with_model(model)['price'])
+        CachedPriceForm.invalidate_localized(model.key)
+        self.assertEqual('3', CachedPriceForm().fill_with_model(model)['price'])
+        self.assertEqual('3', OtherCachedPriceForm().fill_with_model(model)['price'])
+        model.price = Decimal('4')
+        invalidate_localized(model.key)
+        self.assertEqual('4', OtherCachedPriceForm().fill_with_model(model)['price'])
+
+    def test_forms_do_not_share_results(self):
+        model = PriceMock(price=Decimal('1.5'), created=datetime.datetime(2016, 1, 1))
+        model.put()
+        self.assertIn('created', CachedPriceForm().fill_with_model(model))
+        self.assertNotIn('created', OtherCachedPriceForm().fill_with_model(model))
+
+    def test_cached_values_are_copies(self):
+        model = TagsMock(tags=['a', 'b'])
+        model.put()
+        for _ in xrange(3):
+            form = CachedTagsForm()
+            localized = form.fill_with_model(model)
+            self.assertListEqual(['a', 'b'], localized['tags'])
+            self.assertListEqual(['a', 'b'], form.tags)
+            localized['tags'].append('EVIL')
+            form.tags.append('EVIL')
+
+    def test_schema_changes_key(self):
+        model = PriceMock(price=Decimal('1.5'))
+        model.put()
+        OtherCachedPriceForm().fill_with_model(model)
+        model.price = Decimal('2')
+
+        # Same class name and field names, but price became required, as after a deploy
+        deployed = type(str('OtherCachedPriceForm'), (ModelForm,),
+                        {'__module__': __name__, '_model_class': RequiredPriceMock, '_include': ['price'],
+                         '_localized_cache': OtherCachedPriceForm._localized_cache})
+        self.assertEqual('2', deployed().fill_with_model(model)['price'])
+
+    def test_invalidation_after_put(self):
+        model = InvalidatingPriceMock(price=Decimal('1.5'))
+        model.put()
+        InvalidatingPriceForm().fill_with_model(model)
+        InvalidatingPriceForm(price='3').fill_model(model)
+        self.assertEqual('1.5', InvalidatingPriceForm().fill_with_model(model)['price'])
+        model.put()
+        self.assertEqual('3', InvalidatingPriceForm().fill_with_model(model)['price'])
+
+    def test_backend_ttl(self):
+        model = PriceMock(price=Decimal('1.5'))
+        model.put()
+        start = time.time()
+        CachedPriceForm().fill_with_model(model)
+        for expires, value in CachedPriceForm._localized_cache._data.itervalues():
+            self.assertTrue(start + 60 <= expires <= time.time() + 60)
+
+    def test_not_saved(self):
+        model = PriceMock(price=Decimal('1.5'))
+        CachedPriceForm().fill_with_model(model)
+        model.price = Decimal('2')
+        self.assertEqual('2', CachedPriceForm().fill_with_model(model)['price'])
+
+    def test_memcache_version(self):
+        model = PriceMock(price=Decimal('1.5'), created=datetime.datetime(2016, 1, 1))
+        model.put()
+        MemcachedPriceForm().fill_with_model(model)
+        model.price = Decimal('2')
+        self.assertEqual('1.5', MemcachedPriceForm().fill_with_model(model)['price'])
+        model.created = datetime.datetime(2016, 1, 2)
+        self.assertEqual('2', MemcachedPriceForm().fill_with_model(model)['price'])
+
+
 class IntegerModelFormTests(unittest.TestCase):
     def test_fields(self):
         properties = ['integer', 'integer_required', 'integer_repeated',
@@ -314,6 +774,61 @@ class IntegerModelFormTests(unittest.TestCase):
 
         self.assertRaises(InvalidParams, f)
 
+    def test_lazy(self):
+        class IntegerLazy(ModelForm):
+            _model_class = IntegerModelMock
+            _lazy = True
+
+        self.assertDictEqual({}, IntegerLazy._fields)
+        form = IntegerLazy(integer='1')
+        self.assertSetEqual(set(IntegerModelForm._fields.iterkeys()), set(IntegerLazy._fields.iterkeys()))
+        self.assertEqual(1, form.normalize()['integer'])
+        self.assertIsInstance(IntegerLazy._fields['integer_required'], IntegerField)
+        self.assertTrue(IntegerLazy._fields['integer_required'].required)
+
+    def test_lazy_keeps_overriden_fields(self):
+        class IntegerLazy(ModelForm):
+            _model_class = IntegerModelMock
+            _lazy = True
+            integer = StringField()
+
+        IntegerLazy()
+        self.assertIsInstance(IntegerLazy._fields['integer'], StringField)
+        self.assertIsInstance(IntegerLazy._fields['integer_required'], IntegerField)
+
+    def test_lazy_validator_fields(self):
+        class IntegerLazy(ModelForm):
+            _model_class = IntegerModelMock
+            _lazy = True
+
+            @validator('integer', 'integer_required')
+            def validate_integers(self, values):
+                pass
+
+        self.assertDictEqual({}, IntegerLazy._fields)
+
+        def create_form():
+            class TypoLazy(ModelForm):
+                _model_class = IntegerModelMock
+                _lazy = True
+
+                @validator('integr')
+                def validate_integer(self, values):
+                    pass
+
+        self.assertRaises(TypeError, create_form)
+
+    def test_timing_report(self):
+        class IntegerLazy(ModelForm):
+            _model_class = IntegerModelMock
+            _lazy = True
+
+        IntegerLazy.json_schema()
+        report = {(name, phase) for name, phase, seconds in timing_report()}
+        self.assertIn(('%s.IntegerModelForm' % __name__, 'import'), report)
+        self.assertIn(('%s.IntegerLazy' % __name__, 'import'), report)
+        self.assertIn(('%s.IntegerLazy' % __name__, 'first use'), report)
+
     def test_property_options(self):
         self.assertTrue(IntegerModelForm._fields['integer_required'].required)
         self.assertTrue(IntegerModelForm._fields['integer_repeated'].repeated)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import unittest
+
+import gaeforms
+from gaeforms import settings, base
+from gaeforms.base import Form, DateField, DateTimeField, IntegerField
+
+
+class WarmupForm(Form):
+    birth = DateField()
+    created = DateTimeField(format='medium')
+    age = IntegerField()
+
+
+class WarmupTests(unittest.TestCase):
+    def test_report(self):
+        report = gaeforms.warmup(locales=['en_US', 'pt_BR'], timezones=['America/Sao_Paulo'], forms=[WarmupForm])
+        self.assertListEqual([('form', '%s.WarmupForm' % __name__),
+                              ('locale', 'en_US'),
+                              ('locale', 'pt_BR'),
+                              ('timezone', 'America/Sao_Paulo')],
+                             [(kind, name) for kind, name, seconds in report])
+        self.assertIn('_json_schema_cache', WarmupForm.__dict__)
+        self.assertIn(('date_format', 'pt_BR'), WarmupForm._fields['birth']._options._compiled)
+        self.assertIn(('date_format', 'en_US'), WarmupForm._fields['created']._options._compiled)
+
+    def test_defaults(self):
+        report = gaeforms.warmup()
+        expected = [('locale', settings._get_locale()), ('timezone', settings._get_tz())]
+        self.assertListEqual(expected, [(kind, name) for kind, name, seconds in report])
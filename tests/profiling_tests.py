@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import threading
+import unittest
+
+from gaeforms import profiling
+from gaeforms.base import Form, IntegerField, StringField
+
+
+class ProfiledForm(Form):
+    age = IntegerField(repeated=True)
+    name = StringField()
+
+
+@unittest.skipIf(profiling.tracemalloc is None, 'tracemalloc is not available')
+class ProfileAllocationsTests(unittest.TestCase):
+    def test_report(self):
+        validate = Form.__dict__['validate']
+        with profiling.profile_allocations() as report:
+            form = ProfiledForm(age=[str(i) for i in xrange(100)], name='Joe')
+            form.validate()
+            form.normalize()
+        self.assertIs(validate, Form.__dict__['validate'])
+        form_rows = {name: (calls, peak) for kind, name, calls, allocated, peak in report.rows('form')}
+        self.assertSetEqual({'ProfiledForm.validate', 'ProfiledForm.normalize'}, set(form_rows))
+        self.assertEqual(1, form_rows['ProfiledForm.normalize'][0])
+        self.assertGreater(form_rows['ProfiledForm.normalize'][1], 0)
+        field_rows = {name: calls for kind, name, calls, allocated, peak in report.rows('field')}
+        self.assertEqual(1, field_rows['IntegerField.normalize'])
+        self.assertEqual(1, field_rows['StringField.validate'])
+
+
+class TracemallocMock(object):
+    def __init__(self):
+        self.tracing = False
+        self.stops = 0
+
+    def is_tracing(self):
+        return self.tracing
+
+    def start(self):
+        self.tracing = True
+
+    def stop(self):
+        self.tracing = False
+        self.stops += 1
+
+    def get_traced_memory(self):
+        return 0, 0
+
+
+class ConcurrentSessionsTests(unittest.TestCase):
+    def setUp(self):
+        self.tracemalloc = profiling.tracemalloc
+        profiling.tracemalloc = TracemallocMock()
+
+    def tearDown(self):
+        profiling.tracemalloc = self.tracemalloc
+
+    def test_overlapping_threads(self):
+        validate = Form.__dict__['validate']
+        b_started, a_finished, b_report = threading.Event(), threading.Event(), []
+
+        def session_b():
+            with profiling.profile_allocations() as report:
+                b_started.set()
+                a_finished.wait()
+                ProfiledForm(name='Joe').validate()
+            b_report.append(report)
+
+        with profiling.profile_allocations() as a_report:
+            thread = threading.Thread(target=session_b)
+            thread.start()
+            b_started.wait()
+            ProfiledForm(name='Ann').validate()
+        a_finished.set()
+        self.assertIsNot(validate, Form.__dict__['validate'])
+        self.assertTrue(profiling.tracemalloc.tracing)
+        thread.join()
+        self.assertIs(validate, Form.__dict__['validate'])
+        self.assertFalse(profiling.tracemalloc.tracing)
+        self.assertEqual(1, profiling.tracemalloc.stops)
+        for report in (a_report, b_report[0]):
+            self.assertListEqual([('form', 'ProfiledForm.validate', 1, 0, 0)], report.rows('form'))
+
+    def test_other_threads_not_recorded(self):
+        with profiling.profile_allocations() as report:
+            thread = threading.Thread(target=lambda: ProfiledForm(name='Joe').validate())
+            thread.start()
+            thread.join()
+        self.assertListEqual([], report.rows())
+
+
+class ProfilingNotAvailableTests(unittest.TestCase):
+    def test_not_available(self):
+        def profile():
+            with profiling.profile_allocations():
+                pass
+
+        tracemalloc = profiling.tracemalloc
+        profiling.tracemalloc = None
+        try:
+            self.assertRaises(profiling.ProfilingNotAvailable, profile)
+        finally:
+            profiling.tracemalloc = tracemalloc